@@ -0,0 +1,194 @@
+"""
+WebP Converter command line tools: python -m app <command>
+"""
+import sys
+import json
+import asyncio
+from pathlib import Path
+import click
+from app.config import Config
+
+@click.group()
+def cli():
+    """WebP/AVIF converter tools"""
+
+@cli.command('bench-encoders')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'formats', multiple=True, default=('webp', 'avif'),
+              type=click.Choice(['webp', 'avif', 'jpeg']), help='Formats to compare')
+@click.option('--json', 'as_json', is_flag=True, help='Machine-readable output')
+def bench_encoders(paths, formats, as_json):
+    """Compare output bytes and encode time of every available backend"""
+    from app.encoders import benchmark_backends
+
+    result = benchmark_backends(paths, Config(), formats)
+    if as_json:
+        click.echo(json.dumps(result, indent=2))
+        return
+
+    original = result['original_bytes']
+    click.echo(f"{len(paths)} files, {original} bytes original")
+    click.echo(f"{'format':<6} {'backend':<12} {'bytes':>12} {'saved':>7} {'seconds':>9} {'img/s':>7}")
+    for fmt, backends in result['formats'].items():
+        for name, totals in backends.items():
+            saved = (1 - totals['bytes'] / original) * 100 if original else 0
+            rate = totals['files'] / totals['seconds'] if totals['seconds'] else 0
+            click.echo(f"{fmt:<6} {name:<12} {totals['bytes']:>12} {saved:>6.1f}% "
+                       f"{totals['seconds']:>9.2f} {rate:>7.1f}")
+
+@cli.command('bench-engines')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'formats', multiple=True, default=('webp', 'avif'),
+              type=click.Choice(['webp', 'avif', 'jpeg']), help='Formats to convert to')
+@click.option('--json', 'as_json', is_flag=True, help='Machine-readable output')
+def bench_engines(paths, formats, as_json):
+    """Compare peak RSS and throughput of the pillow and vips engines"""
+    from app.vips_engine import benchmark_engines
+
+    result = benchmark_engines(paths, Config(), formats)
+    if as_json:
+        click.echo(json.dumps(result, indent=2))
+        return
+
+    click.echo(f"{result['files']} files x {len(formats)} formats, "
+               f"{result['original_bytes']} bytes original")
+    click.echo(f"{'engine':<8} {'base MB':>8} {'peak MB':>8} {'seconds':>9} {'img/s':>7} {'MB/s':>7} {'bytes':>12}")
+    for engine, totals in result['engines'].items():
+        click.echo(f"{engine:<8} {totals['baseline_rss_mb']:>8.1f} {totals['peak_rss_mb']:>8.1f} "
+                   f"{totals['seconds']:>9.2f} {totals['images_per_second']:>7.1f} "
+                   f"{totals['mb_per_second']:>7.1f} {totals['output_bytes']:>12}")
+
+@cli.command('bench-pipeline')
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('--workers', '-j', default=1, show_default=True, help='Worker processes')
+@click.option('--seed', default=1, show_default=True, help='Corpus seed')
+@click.option('--copies', default=3, show_default=True, help='Images per corpus size')
+@click.option('--quick', is_flag=True, help='Leave out originals above 4 MP')
+@click.option('--save', 'save_file', type=click.File('w'), help='Write result JSON (new baseline)')
+@click.option('--baseline', 'baseline_file', type=click.File('r'), help='Compare with saved result')
+@click.option('--tolerance', default=10.0, show_default=True, help='Allowed regression, percent')
+@click.option('--json', 'as_json', is_flag=True, help='Machine-readable output')
+def bench_pipeline(directory, workers, seed, copies, quick, save_file, baseline_file,
+                   tolerance, as_json):
+    """Convert a synthetic corpus through the pipeline and report throughput"""
+    from app.benchmark import run_benchmark, compare
+    from app.logger import setup_logger
+
+    setup_logger('WARNING')
+    result = asyncio.run(run_benchmark(Path(directory), Config(), workers, seed, quick, copies))
+    if save_file:
+        save_file.write(json.dumps(result, indent=2) + '\n')
+    rows = compare(result, json.load(baseline_file), tolerance) if baseline_file else []
+
+    if as_json:
+        click.echo(json.dumps({**result, 'comparison': [
+            {'metric': name, 'baseline': old, 'current': new, 'change': change, 'regressed': bad}
+            for name, old, new, change, bad in rows
+        ]}, indent=2))
+    else:
+        corpus = result['corpus']
+        click.echo(f"{corpus['files']} files, {corpus['bytes'] / 2**20:.1f} MB, "
+                   f"{result['workers']} workers, engine {result['engine']}")
+        click.echo(f"{result['images_per_second']:.2f} img/s  {result['mb_per_second']:.2f} MB/s  "
+                   f"peak RSS {result['peak_rss_mb']:.0f} MB  errors {result['errors']}")
+        click.echo(f"{'stage':<16} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for stage, stats in result['stages'].items():
+            click.echo(f"{stage:<16} {stats['count']:>6} {stats['p50'] * 1000:>9.1f} "
+                       f"{stats['p95'] * 1000:>9.1f} {stats['p99'] * 1000:>9.1f}")
+        if rows:
+            click.echo(f"\n{'metric':<24} {'baseline':>10} {'current':>10} {'change':>8}")
+            for name, old, new, change, bad in rows:
+                click.echo(f"{name:<24} {old:>10.4g} {new:>10.4g} {change:>+7.1f}%"
+                           + ('  REGRESSION' if bad else ''))
+
+    if any(bad for *_, bad in rows):
+        sys.exit(1)
+
+@cli.command('bench-latency')
+@click.option('--rate', default=1.0, show_default=True, help='Steady phase, files per second')
+@click.option('--duration', default=10.0, show_default=True, help='Steady phase seconds (0 = skip)')
+@click.option('--burst', 'bursts', multiple=True, type=int, default=(100, 1000),
+              show_default=True, help='Files created at once, repeatable')
+@click.option('--workers', '-j', default=2, show_default=True, help='Worker processes')
+@click.option('--timeout', default=300.0, show_default=True, help='Seconds to wait per phase')
+@click.option('--json', 'as_json', is_flag=True, help='Machine-readable output')
+def bench_latency(rate, duration, bursts, workers, timeout, as_json):
+    """Watcher-to-output latency for steady and burst file creation"""
+    from app.latency_bench import run_latency_benchmark
+    from app.logger import setup_logger
+
+    setup_logger('ERROR')
+    reports = asyncio.run(run_latency_benchmark(Config(), rate, duration, bursts, workers, timeout))
+    if as_json:
+        click.echo(json.dumps(reports, indent=2))
+        return
+
+    for report in reports:
+        click.echo(f"{report['phase']}: {report['files']} files, {report['processed']} processed, "
+                   f"{report['dropped']} dropped, {report['duplicates']} duplicates, "
+                   f"{report['events']} events, drained in {report['drain_seconds']:.1f}s")
+        click.echo(f"  {'output':<6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, stats in report['latency'].items():
+            if stats:
+                click.echo(f"  {name:<6} {stats['p50'] * 1000:>9.0f} {stats['p95'] * 1000:>9.0f} "
+                           f"{stats['p99'] * 1000:>9.0f} {stats['max'] * 1000:>9.0f}")
+    if any(report['dropped'] for report in reports):
+        sys.exit(1)
+
+def _format_eta(seconds):
+    if seconds is None:
+        return '--:--'
+    minutes, seconds = divmod(int(seconds), 60)
+    return f'{minutes // 60}:{minutes % 60:02d}:{seconds:02d}'
+
+@cli.command('convert')
+@click.argument('paths', nargs=-1, type=click.Path(exists=True))
+@click.option('--from-file', 'list_file', type=click.File('r'),
+              help='Read paths, one per line ("-" for stdin)')
+@click.option('--workers', '-j', type=int, help='Worker processes (default: container CPU budget)')
+@click.option('--state', 'state_path',
+              help="State database (default: bulk_state_db; ':memory:' keeps none)")
+@click.option('--summary', 'summary_file', type=click.File('w'),
+              help='Write JSON summary to file ("-" for stdout)')
+@click.option('--interval', default=1.0, show_default=True, help='Progress interval, seconds')
+@click.option('--log-level', default='WARNING', show_default=True)
+def convert(paths, list_file, workers, state_path, summary_file, interval, log_level):
+    """Convert files and directory trees with the service pipeline"""
+    from itertools import chain
+    from app.bulk import iter_files, run_bulk
+    from app.cpu_layout import CpuLayout
+    from app.logger import setup_logger
+
+    setup_logger(log_level)
+    config = Config()
+    workers = workers or CpuLayout(config, 1).budget
+    # Pruning, animation and settings decisions carry over between runs, in a
+    # database of its own so the service's writer is not contended
+    state_path = state_path or config.bulk_state_db
+    if list_file:
+        paths += tuple(line.strip() for line in list_file if line.strip())
+    files = iter_files(paths, config.extensions)
+    first = next(files, None)
+    if first is None:
+        raise click.UsageError('No image files found')
+
+    def progress(p):
+        total = f"{p['total']}+" if p['scanning'] else p['total']
+        click.echo(f"\r{p['done']}/{total} files  {p['files_per_second']:.1f} files/s  "
+                   f"{p['mb_per_second']:.1f} MB/s  ETA {_format_eta(p['eta_seconds'])}",
+                   err=True, nl=False)
+
+    summary = asyncio.run(run_bulk(chain([first], files), config, workers, state_path,
+                                   progress, interval))
+    click.echo('', err=True)
+
+    if summary_file:
+        summary_file.write(json.dumps(summary, indent=2) + '\n')
+    click.echo(f"{summary['converted']} converted, {summary['skipped']} up to date, "
+               f"{summary['invalid']} invalid, {summary['errors']} failed "
+               f"in {summary['seconds']:.1f}s", err=True)
+    if summary['errors']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    cli()
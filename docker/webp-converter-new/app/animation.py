@@ -0,0 +1,56 @@
+"""
+Animated GIF to animated WebP/AVIF
+"""
+from pathlib import Path
+from PIL import Image
+
+def is_animated(img: Image.Image) -> bool:
+    """Image has more than one frame"""
+    return getattr(img, 'is_animated', False)
+
+def record_durations(img: Image.Image) -> list:
+    """Per-frame durations in ms, filled in as the encoder seeks to each frame.
+
+    GIF seeks decode every frame up to the target, so reading durations
+    in a pass of their own would decode the whole animation twice. The
+    WebP and AVIF encoders read duration[i] only after seeking to frame i.
+    """
+    durations = []
+    seek = img.seek
+
+    def recording_seek(frame):
+        seek(frame)
+        if frame == len(durations):
+            durations.append(img.info.get('duration', 100))
+
+    img.seek = recording_seek
+    return durations
+
+def convert_animation(img: Image.Image, output_path: Path, fmt: str, options: dict, config) -> dict:
+    """Encode all frames of an animated image.
+
+    Pillow's save_all seeks through the source one frame at a time, so
+    only the current frame is decoded in memory. Files above the frame or
+    total pixel budget are not converted and nginx keeps serving the GIF.
+    """
+    frames = img.n_frames
+    pixels = img.width * img.height * frames
+
+    if frames > config.animated_max_frames or pixels > config.animated_max_pixels:
+        return {'skip_reason': 'budget', 'frames': frames}
+    if fmt == 'avif' and not config.animated_avif:
+        return {'skip_reason': 'avif_disabled', 'frames': frames}
+
+    options = {**options,
+               'save_all': True,
+               'duration': record_durations(img),
+               'loop': img.info.get('loop', 0)}
+    if fmt == 'webp':
+        # Let libwebp pick lossy or lossless per frame, GIF frames are often flat
+        options['allow_mixed'] = True
+
+    try:
+        img.save(output_path, fmt.upper(), **options)
+    finally:
+        del img.seek
+    return {'content_class': 'animation', 'frames': frames}
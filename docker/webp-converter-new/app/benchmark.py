@@ -0,0 +1,192 @@
+"""
+Converter throughput benchmark on a reproducible synthetic corpus
+"""
+import json
+import time
+import resource
+import dataclasses
+from pathlib import Path
+import numpy as np
+from PIL import Image, ImageDraw
+from app.bulk import BulkConverter, collect_files, run_bulk
+
+# Kind and size of every corpus image, roughly 10 KB to 20 MP
+CORPUS_SPEC = (
+    ('jpeg', (240, 180)),
+    ('jpeg', (640, 480)),
+    ('jpeg', (1920, 1080)),
+    ('jpeg', (4000, 3000)),
+    ('jpeg', (5472, 3648)),
+    ('png', (1024, 768)),
+    ('png', (2560, 1440)),
+    ('palette', (800, 600)),
+    ('palette', (1600, 1200)),
+    ('alpha', (512, 512)),
+    ('alpha', (2048, 2048)),
+)
+# --quick leaves out the camera-sized originals
+QUICK_MAX_PIXELS = 4_000_000
+
+MANIFEST = 'corpus.json'
+# Higher is better for these, lower for everything else
+HIGHER_IS_BETTER = ('images_per_second', 'mb_per_second')
+# Stage latency changes below this are timer noise, never a regression
+NOISE_FLOOR_SECONDS = 0.005
+
+def photo(rng, size):
+    """Smooth color field with sensor-like noise"""
+    width, height = size
+    field = rng.integers(0, 256, (max(2, height // 64), max(2, width // 64), 3), dtype=np.uint8)
+    base = np.asarray(Image.fromarray(field).resize(size, Image.Resampling.BICUBIC), dtype=np.int16)
+    base += rng.integers(-12, 13, base.shape, dtype=np.int16)
+    return Image.fromarray(np.clip(base, 0, 255).astype(np.uint8))
+
+def _graphic(rng, size, colors=None):
+    """Flat shapes and text-like strokes on a gradient, UI/screenshot-like"""
+    width, height = size
+    gradient = np.linspace(200, 255, width, dtype=np.float32)
+    img = Image.fromarray(np.broadcast_to(gradient, (height, width)).astype(np.uint8)).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for _ in range(60):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        w, h = int(rng.integers(8, width // 4 + 9)), int(rng.integers(8, height // 4 + 9))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        if rng.random() < 0.5:
+            draw.rectangle((x, y, x + w, y + h), fill=color)
+        else:
+            draw.ellipse((x, y, x + w, y + h), fill=color)
+    # Rows of short strokes standing in for text
+    for y in range(8, height - 8, 14):
+        x = 8
+        while x < width - 40:
+            length = int(rng.integers(4, 40))
+            draw.line((x, y, x + length, y), fill=(30, 30, 30), width=2)
+            x += length + int(rng.integers(4, 12))
+    return img.quantize(colors) if colors else img
+
+def _alpha(rng, size):
+    """Photo with a soft radial alpha mask"""
+    width, height = size
+    img = photo(rng, size).convert('RGBA')
+    y, x = np.ogrid[:height, :width]
+    distance = np.hypot((x - width / 2) / (width / 2), (y - height / 2) / (height / 2))
+    img.putalpha(Image.fromarray((np.clip(1.2 - distance, 0, 1) * 255).astype(np.uint8)))
+    return img
+
+def _spec(quick: bool, copies: int):
+    spec = [(kind, size) for kind, size in CORPUS_SPEC
+            if not quick or size[0] * size[1] <= QUICK_MAX_PIXELS]
+    return [(kind, size, copy) for copy in range(copies) for kind, size in spec]
+
+def generate_corpus(directory: Path, seed: int = 1, quick: bool = False, copies: int = 3):
+    """Write the corpus unless the manifest shows it is already there.
+
+    Every image is derived from (seed, index) only, so corpora are
+    byte-identical across machines with the same Pillow/NumPy versions.
+    """
+    directory = Path(directory)
+    manifest = {'seed': seed, 'quick': quick, 'copies': copies}
+    manifest_path = directory / MANIFEST
+    if manifest_path.exists() and json.loads(manifest_path.read_text()) == manifest:
+        return
+
+    directory.mkdir(parents=True, exist_ok=True)
+    for index, (kind, size, copy) in enumerate(_spec(quick, copies)):
+        rng = np.random.default_rng([seed, index])
+        name = f'{kind}-{size[0]}x{size[1]}-{copy}'
+        if kind == 'jpeg':
+            photo(rng, size).save(directory / f'{name}.jpg', quality=90)
+        elif kind == 'png':
+            _graphic(rng, size).save(directory / f'{name}.png')
+        elif kind == 'palette':
+            _graphic(rng, size, colors=64).save(directory / f'{name}.png')
+        else:
+            _alpha(rng, size).save(directory / f'{name}.png')
+    manifest_path.write_text(json.dumps(manifest))
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))]
+
+class TimedConverter(BulkConverter):
+    """BulkConverter keeping per-file and per-stage latencies"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = {'file': []}
+
+    async def _process_file(self, file_path, worker_id):
+        start = time.perf_counter()
+        await super()._process_file(file_path, worker_id)
+        self.latencies['file'].append(time.perf_counter() - start)
+
+    def _record_encode_stats(self, fmt, stats, original_size, output_size):
+        super()._record_encode_stats(fmt, stats, original_size, output_size)
+        for stage, seconds in stats.get('timings', {}).items():
+            # Every format decodes on its own, so stages are split per format
+            self.latencies.setdefault(f'{stage}_{fmt}', []).append(seconds)
+
+    def report(self):
+        return {'stages': {
+            stage: {'count': len(values),
+                    'p50': percentile(values, 50),
+                    'p95': percentile(values, 95),
+                    'p99': percentile(values, 99)}
+            for stage, values in sorted(self.latencies.items()) if values
+        }}
+
+async def run_benchmark(directory: Path, config, workers: int = 1, seed: int = 1,
+                        quick: bool = False, copies: int = 3) -> dict:
+    """Generate corpus if needed and convert all of it through the pipeline"""
+    generate_corpus(directory, seed, quick, copies)
+    files = collect_files([directory], config.extensions)
+    # Outputs of the previous run must not be skipped as up to date
+    config = dataclasses.replace(config, force_reconvert=True)
+
+    summary = await run_bulk(files, config, workers, ':memory:',
+                             converter_class=TimedConverter)
+    return {
+        'corpus': {'files': len(files), 'bytes': summary['input_bytes'],
+                   'seed': seed, 'quick': quick, 'copies': copies},
+        'workers': workers,
+        'engine': config.conversion_engine,
+        'profile': config.encode_profile,
+        'errors': summary['errors'],
+        'seconds': summary['seconds'],
+        'images_per_second': summary['files_per_second'],
+        'mb_per_second': summary['mb_per_second'],
+        'output_bytes': summary['output_bytes'],
+        # Children are reaped after stop(), so this is the largest worker process
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        'stages': summary['stages'],
+    }
+
+def _flatten(result: dict) -> dict:
+    """Comparable scalar metrics of a result"""
+    flat = {name: result[name] for name in
+            ('images_per_second', 'mb_per_second', 'peak_rss_mb')}
+    for stage, stats in result['stages'].items():
+        for q in ('p50', 'p95', 'p99'):
+            flat[f'{stage}.{q}'] = stats[q]
+    return flat
+
+def compare(result: dict, baseline: dict, tolerance: float = 10.0):
+    """Per-metric change against baseline in percent (positive = better).
+
+    Returns rows of (metric, baseline, current, change, regressed).
+    """
+    current, previous = _flatten(result), _flatten(baseline)
+    rows = []
+    for name in sorted(current.keys() & previous.keys()):
+        old, new = previous[name], current[name]
+        if not old:
+            continue
+        change = (new - old) / old * 100
+        if not name.startswith(HIGHER_IS_BETTER):
+            change = -change
+        regressed = change < -tolerance
+        if '.' in name and abs(new - old) < NOISE_FLOOR_SECONDS:
+            regressed = False
+        rows.append((name, old, new, change, regressed))
+    return rows
@@ -0,0 +1,169 @@
+"""
+Offline bulk conversion through the regular ImageConverter pipeline
+"""
+import os
+import time
+import asyncio
+from itertools import islice
+from pathlib import Path
+from app.converter import ImageConverter
+from app.queue_manager import QueueManager
+from app.cpu_layout import CpuLayout
+from app.state import StateStore
+
+# Files taken from the directory walk per thread hand-off
+SCAN_BATCH = 1000
+
+def _walk(top: str, extensions):
+    """Files below top by extension, depth-first, sorted within each directory"""
+    stack = [top]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.name.rpartition('.')[2].lower() in extensions and entry.is_file():
+                yield Path(entry.path)
+        stack.extend(reversed(subdirs))
+
+def iter_files(paths, extensions):
+    """Files from a path list, directories walked recursively by extension.
+
+    Lazy, so millions of files are never held in memory at once.
+    """
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from _walk(str(path), extensions)
+        elif path.is_file():
+            yield path
+
+def collect_files(paths, extensions):
+    """iter_files as a list, for small trees"""
+    return list(iter_files(paths, extensions))
+
+class BulkQueue(QueueManager):
+    """Queue that also keeps per-status counts, bytes and failures"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.counts = {}
+        self.failures = []
+        self.last_status = {}
+
+    def mark_completed(self, worker_id, file_path, status, duration=None, error=None):
+        super().mark_completed(worker_id, file_path, status, duration, error)
+        self.counts[status] = self.counts.get(status, 0) + 1
+        self.last_status[worker_id] = status
+        if error:
+            self.failures.append({'file': file_path, 'error': error})
+
+class BulkConverter(ImageConverter):
+    """ImageConverter that totals input and output bytes per file"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.files_done = 0
+        self.input_bytes = 0
+        self.output_bytes = {}
+
+    async def _process_file(self, file_path, worker_id):
+        file_path = Path(file_path)
+        await super()._process_file(file_path, worker_id)
+
+        self.files_done += 1
+        try:
+            self.input_bytes += file_path.stat().st_size
+        except OSError:
+            return
+        if self.queue.last_status.get(worker_id) == 'success':
+            for fmt in self.formats:
+                output_path = file_path.with_suffix(f'.{fmt}')
+                if output_path.exists():
+                    self.output_bytes[fmt] = (self.output_bytes.get(fmt, 0)
+                                              + output_path.stat().st_size)
+
+    def report(self) -> dict:
+        """Extra summary fields of subclasses"""
+        return {}
+
+def _progress(converter, total: int, scanning: bool, elapsed: float) -> dict:
+    done = converter.files_done
+    files_per_second = done / elapsed if elapsed else 0
+    return {
+        'done': done,
+        'total': total,
+        'scanning': scanning,
+        'files_per_second': files_per_second,
+        'mb_per_second': converter.input_bytes / 2**20 / elapsed if elapsed else 0,
+        # Unknown until the walk has found every file
+        'eta_seconds': ((total - done) / files_per_second
+                        if files_per_second and not scanning else None),
+    }
+
+async def run_bulk(files, config, workers: int, state_path: str,
+                   on_progress=None, interval: float = 1.0,
+                   converter_class=BulkConverter) -> dict:
+    """Convert files (any iterable, walked in a thread as the bounded queue
+    drains) with workers processes, returns a summary.
+
+    Up-to-date outputs are skipped by the pipeline itself. on_progress(dict)
+    is called every interval seconds and once at the end.
+    """
+    queue = BulkQueue(config)
+    state = StateStore(state_path)
+    formats = ('webp',) if config.avif_tier == 'hot' else ('webp', 'avif')
+    converter = converter_class(config, queue, state, formats=formats, worker_count=workers,
+                                layout=CpuLayout(config, workers))
+
+    start = time.monotonic()
+    workers_task = asyncio.create_task(converter.start())
+    scan = {'found': 0, 'scanning': True}
+
+    async def report():
+        while True:
+            await asyncio.sleep(interval)
+            on_progress(_progress(converter, scan['found'], scan['scanning'],
+                                  time.monotonic() - start))
+
+    reporter = asyncio.create_task(report()) if on_progress else None
+    files = iter(files)
+    try:
+        # Directory walks block, so they run in a thread; puts wait for room
+        while batch := await asyncio.to_thread(lambda: list(islice(files, SCAN_BATCH))):
+            scan['found'] += len(batch)
+            for file_path in batch:
+                await queue.put(str(file_path))
+        scan['scanning'] = False
+        await queue.join()
+    finally:
+        if reporter:
+            reporter.cancel()
+        await converter.stop()
+        await workers_task
+        state.close()
+
+    elapsed = time.monotonic() - start
+    progress = _progress(converter, scan['found'], False, elapsed)
+    if on_progress:
+        on_progress(progress)
+
+    return {
+        'files': scan['found'],
+        'converted': queue.counts.get('success', 0),
+        'skipped': queue.counts.get('skipped', 0),
+        'invalid': queue.counts.get('invalid', 0),
+        'errors': queue.counts.get('error', 0),
+        'input_bytes': converter.input_bytes,
+        'output_bytes': converter.output_bytes,
+        'seconds': elapsed,
+        'files_per_second': progress['files_per_second'],
+        'mb_per_second': progress['mb_per_second'],
+        'workers': workers,
+        'failures': queue.failures,
+        **converter.report(),
+    }
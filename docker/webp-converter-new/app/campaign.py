@@ -0,0 +1,269 @@
+"""
+Off-peak re-encode campaign for outputs produced with old encoder settings
+"""
+import os
+import time
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from app.converter import settings_fingerprint
+from app.metrics import metrics
+from app.worker_pool import WorkerProcess
+import structlog
+
+logger = structlog.get_logger()
+
+WORKER_ID = 'campaign'
+META_KEY = 'campaign'
+SEEDED_KEY = 'campaign_seeded'
+SEED_BATCH = 1000
+
+def parse_window(window: str):
+    """'HH:MM-HH:MM' -> (start, end) minutes of day, None for any time"""
+    if not window:
+        return None
+    start, _, end = window.partition('-')
+    minutes = []
+    for text in (start, end):
+        hours, _, mins = text.strip().partition(':')
+        minutes.append(int(hours) * 60 + int(mins or 0))
+    return tuple(minutes)
+
+def in_window(window, now: datetime) -> bool:
+    """Local time inside window, which may wrap past midnight"""
+    if window is None:
+        return True
+    start, end = window
+    minute = now.hour * 60 + now.minute
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+def window_fraction(window) -> float:
+    """Share of the day covered by window"""
+    if window is None:
+        return 1.0
+    start, end = window
+    return ((end - start) % 1440 or 1440) / 1440
+
+def scan_outputs(watch_dir: str, extensions, formats):
+    """Batches of (path, source, format, size, source_mtime) for outputs
+    lying next to their originals under watch_dir"""
+    batch = []
+    for directory, _, names in os.walk(watch_dir):
+        present = set(names)
+        for name in names:
+            stem, _, extension = name.rpartition('.')
+            if not stem or extension.lower() not in extensions:
+                continue
+            source = os.path.join(directory, name)
+            for fmt in formats:
+                output = f'{stem}.{fmt}'
+                if output not in present:
+                    continue
+                try:
+                    size = os.stat(os.path.join(directory, output)).st_size
+                    source_mtime = os.stat(source).st_mtime
+                except OSError:
+                    continue
+                batch.append((os.path.join(directory, output), source, fmt, size, source_mtime))
+        if len(batch) >= SEED_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class ReencodeCampaign:
+    """Brings outputs in line with the current encoder settings.
+
+    Every output records a fingerprint of the settings it was produced
+    with. When they change (or a format is newly enabled), the campaign
+    re-encodes the affected sources inside campaign_window, only while the
+    lanes are idle, and spends at most campaign_cpu_share of its time
+    encoding. Progress lives in the state database, so a restart resumes
+    where the campaign stopped.
+    """
+
+    def __init__(self, config, converter, queue_manager, state, avif_queue=None):
+        self.config = config
+        self.converter = converter
+        # Main lane and, in the hot tier, the AVIF lane
+        self.queues = [queue for queue in (queue_manager, avif_queue) if queue is not None]
+        self.state = state
+        self.running = True
+        self.window = parse_window(config.campaign_window)
+        self.share = min(max(config.campaign_cpu_share, 0.01), 1.0)
+        self.progress = None
+        self.process = WorkerProcess(WORKER_ID, config, nice=19,
+                                     layout=converter.layout, pinned=False)
+
+    def _formats(self):
+        """Enabled formats whose outputs are kept current"""
+        return [fmt for fmt in ('webp', 'avif') if getattr(self.config, f'enable_{fmt}')]
+
+    def _new_formats(self):
+        """Formats this lane creates for every source"""
+        return [fmt for fmt in self.converter.formats if fmt in self._formats()]
+
+    def _settings(self) -> dict:
+        return {fmt: settings_fingerprint(fmt, self.config) for fmt in self._formats()}
+
+    def _count(self, settings: dict) -> int:
+        """Outputs left to re-encode or create"""
+        return (sum(self.state.count_outdated(fmt, fp) for fmt, fp in settings.items())
+                + sum(self.state.count_missing(fmt) for fmt in self._new_formats()))
+
+    async def _seed(self):
+        """Record outputs made before the state database existed, once.
+
+        They have no settings recorded, so outdated() counts them in.
+        """
+        if self.state.get_meta(SEEDED_KEY):
+            return
+        batches = scan_outputs(self.config.watch_dir, self.config.extensions, self._formats())
+        added = 0
+        # Walk in a thread, write to SQLite from the loop that owns the connection
+        batch = await asyncio.to_thread(next, batches, None)
+        while batch is not None:
+            if not self.running:
+                # Interrupted - rows added so far stay, the walk restarts next time
+                return
+            added += self.state.seed(batch)
+            batch = await asyncio.to_thread(next, batches, None)
+
+        self.state.set_meta(SEEDED_KEY, {'at': time.time(), 'added': added})
+        if added:
+            # A stored campaign for the same settings would not count them
+            self.state.set_meta(META_KEY, None)
+            logger.info("Recorded outputs without conversion state", added=added)
+
+    def _load(self):
+        """Resume stored campaign or start one for the current settings"""
+        settings = self._settings()
+        progress = self.state.get_meta(META_KEY)
+        if progress and progress.get('settings') == settings:
+            self.progress = progress
+            if not progress.get('finished_at'):
+                logger.info("Resuming re-encode campaign",
+                           done=progress['done'], total=progress['total'])
+            return
+
+        total = self._count(settings)
+        self.progress = {
+            'settings': settings,
+            'total': total,
+            'done': 0,
+            'started_at': time.time(),
+            'active_seconds': 0.0,
+            'finished_at': None if total else time.time(),
+        }
+        self._save()
+        if total:
+            logger.info("Starting re-encode campaign", total=total, settings=settings)
+
+    def _save(self):
+        self.state.set_meta(META_KEY, self.progress)
+        metrics.campaign_total.set(self.progress['total'])
+        metrics.campaign_done.set(self.progress['done'])
+        metrics.campaign_eta.set(self.eta() or 0)
+
+    def _cpu_available(self) -> bool:
+        """Inside the window, nothing queued in any lane and system load below threshold"""
+        if not in_window(self.window, datetime.now()):
+            return False
+        if any(queue.busy() for queue in self.queues):
+            return False
+        return self.converter.layout.load() < self.config.campaign_max_load
+
+    def _pending(self) -> dict:
+        """Next batch as source -> formats to re-encode"""
+        limit = self.config.campaign_batch
+        pending = {}
+        # Width variant rows are neither counted nor listed, refresh() regenerates them
+        for fmt, fp in self.progress['settings'].items():
+            for record in self.state.outdated(fmt, fp, limit):
+                pending.setdefault(Path(record['source']), set()).add(fmt)
+        for fmt in self._new_formats():
+            for source in self.state.missing(fmt, limit):
+                pending.setdefault(Path(source), set()).add(fmt)
+        return dict(list(pending.items())[:limit])
+
+    def eta(self):
+        """Wall-clock seconds left at the observed rate, None before the first file"""
+        progress = self.progress
+        if not progress or not progress['done'] or progress['finished_at']:
+            return None
+        remaining = max(0, progress['total'] - progress['done'])
+        per_output = progress['active_seconds'] / progress['done']
+        # Encoding happens only in the window and at the configured duty cycle
+        duty = self.share * window_fraction(self.window)
+        return remaining * per_output / duty
+
+    def status(self) -> dict:
+        if not self.progress:
+            return {'enabled': self.config.campaign_enabled}
+        return {
+            'enabled': self.config.campaign_enabled,
+            'window': self.config.campaign_window,
+            'total': self.progress['total'],
+            'done': self.progress['done'],
+            'started_at': self.progress['started_at'],
+            'finished_at': self.progress['finished_at'],
+            'eta_seconds': self.eta(),
+        }
+
+    async def start(self):
+        """Re-encode outdated sources in small batches while CPU allows"""
+        if not self.config.campaign_enabled:
+            return
+
+        self.converter.processes[WORKER_ID] = self.process
+        await self._seed()
+        if not self.running:
+            return
+        self._load()
+
+        while self.running:
+            await asyncio.sleep(self.config.campaign_interval)
+            if self.progress['finished_at'] or not self._cpu_available():
+                continue
+
+            batch = self._pending()
+            if not batch:
+                self.progress['finished_at'] = time.time()
+                self._save()
+                logger.info("Re-encode campaign finished", done=self.progress['done'])
+                continue
+
+            for source, formats in batch.items():
+                if not self.running or not self._cpu_available():
+                    break
+
+                start = time.monotonic()
+                try:
+                    await self.converter.refresh(source, sorted(formats), WORKER_ID)
+                    for fmt in formats:
+                        metrics.campaign_reencoded.labels(format=fmt).inc()
+                except Exception as e:
+                    # Stamp anyway so a broken file is not retried forever
+                    for fmt in formats:
+                        self.state.record(source.with_suffix(f'.{fmt}'), source, fmt,
+                                          settings=self.progress['settings'][fmt])
+                    logger.warning("Campaign re-encode failed",
+                                   file=str(source),
+                                   error=str(e))
+
+                elapsed = time.monotonic() - start
+                self.progress['done'] += len(formats)
+                self.progress['active_seconds'] += elapsed
+                self._save()
+
+                # Stay within the CPU share: idle in proportion to work done
+                await asyncio.sleep(elapsed * (1 - self.share) / self.share)
+
+            await self.process.maybe_recycle()
+
+    async def stop(self):
+        """Stop campaign, progress is already persisted"""
+        self.running = False
+        await self.process.stop()
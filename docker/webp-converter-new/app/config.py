@@ -3,7 +3,7 @@ Configuration management from environment variables and config.yml
 """
 import os
 from dataclasses import dataclass, field
-from typing import List
+from typing import Dict, List
 import yaml
 from pathlib import Path
 
@@ -16,19 +16,130 @@ class Config:
     # Conversion parameters
     webp_quality: int = int(os.getenv('WEBP_QUALITY', '85'))
     avif_quality: int = int(os.getenv('AVIF_QUALITY', '80'))
+    jpeg_quality: int = int(os.getenv('JPEG_QUALITY', '85'))  # optimized progressive JPEG outputs
     min_file_size: int = int(os.getenv('WEBP_MIN_FILE_SIZE', '10240'))  # 10KB
     force_reconvert: bool = os.getenv('WEBP_FORCE_RECONVERT', 'false').lower() == 'true'
+
+    # Quality mode: 'fixed' uses *_quality, 'ssim' searches the lowest
+    # quality reaching ssim_target (first trial at *_quality)
+    quality_mode: str = os.getenv('WEBP_QUALITY_MODE', 'fixed')
+    ssim_target: float = float(os.getenv('WEBP_SSIM_TARGET', '0.98'))
+    ssim_min_quality: int = int(os.getenv('WEBP_SSIM_MIN_QUALITY', '40'))
+    ssim_max_quality: int = int(os.getenv('WEBP_SSIM_MAX_QUALITY', '95'))
+    ssim_max_trials: int = int(os.getenv('WEBP_SSIM_MAX_TRIALS', '5'))
+    ssim_max_side: int = int(os.getenv('WEBP_SSIM_MAX_SIDE', '512'))  # luma plane size
+
+    # Content-aware encoding for non-JPEG sources: lossless WebP for flat
+    # graphics, opaque alpha dropped, alpha_quality tuned for soft alpha
+    content_aware: bool = os.getenv('WEBP_CONTENT_AWARE', 'true').lower() == 'true'
+    lossless_max_colors: int = int(os.getenv('WEBP_LOSSLESS_MAX_COLORS', '256'))
+    lossless_max_entropy: float = float(os.getenv('WEBP_LOSSLESS_MAX_ENTROPY', '3.0'))  # bits
+    webp_alpha_quality: int = int(os.getenv('WEBP_ALPHA_QUALITY', '85'))
+
+    # Max output side per glob (relative to watch_dir), first match wins, 0 = unlimited
+    max_dimensions: Dict[str, int] = field(default_factory=dict)
+
+    # Responsive width ladder, photo.jpg -> photo.640w.webp (empty = disabled)
+    responsive_widths: List[int] = field(default_factory=lambda: [
+        int(width) for width in os.getenv('WEBP_RESPONSIVE_WIDTHS', '').split(',') if width.strip()
+    ])
+
+    # Metadata: EXIF orientation is always applied to pixels; strip EXIF/XMP,
+    # ICC 'srgb' converts to sRGB and drops the profile, 'keep' or 'strip'
+    strip_metadata: bool = os.getenv('WEBP_STRIP_METADATA', 'true').lower() == 'true'
+    icc_policy: str = os.getenv('WEBP_ICC_POLICY', 'srgb')
+
+    # Animated GIF conversion budget per file
+    animated_max_frames: int = int(os.getenv('WEBP_ANIMATED_MAX_FRAMES', '500'))
+    animated_max_pixels: int = int(os.getenv('WEBP_ANIMATED_MAX_PIXELS', '100000000'))  # w*h*frames
+    animated_avif: bool = os.getenv('WEBP_ANIMATED_AVIF', 'true').lower() == 'true'
+
+    # Variant pruning: discard WebP not this much smaller than the original (%),
+    # AVIF not this much smaller than the WebP or original
+    prune_variants: bool = os.getenv('WEBP_PRUNE_VARIANTS', 'true').lower() == 'true'
+    webp_min_savings: float = float(os.getenv('WEBP_MIN_SAVINGS', '5'))
+    avif_min_savings: float = float(os.getenv('AVIF_MIN_SAVINGS', '5'))
+
+    # Encoder speed profiles: webp_method 0-6 (slow=small), avif_speed 0-10 (fast=large)
+    encoder_profiles: Dict[str, Dict[str, int]] = field(default_factory=lambda: {
+        'fast': {'webp_method': 2, 'avif_speed': 9},
+        'balanced': {'webp_method': 4, 'avif_speed': 6},
+        'max': {'webp_method': 6, 'avif_speed': 3},
+    })
+    encode_profile: str = os.getenv('WEBP_ENCODE_PROFILE', 'fast')
+
+    # Encoder backend per format: pillow, pillow-heif (avif), cwebp, avifenc
+    encoder_backends: Dict[str, str] = field(default_factory=lambda: {
+        'webp': os.getenv('WEBP_ENCODER_BACKEND', 'pillow'),
+        'avif': os.getenv('AVIF_ENCODER_BACKEND', 'pillow'),
+    })
+    encoder_binaries: Dict[str, str] = field(default_factory=dict)  # backend -> binary path
+    external_encoder_timeout: int = int(os.getenv('WEBP_EXTERNAL_ENCODER_TIMEOUT', '120'))  # seconds
+
+    # Encoder threads per worker process (0 = CPU budget / workers) and AVIF
+    # tiling ('auto' or 'RxC' as log2 rows x cols); cpu_pinning binds each
+    # worker process to its own CPUs from the cgroup cpuset
+    encoder_threads: int = int(os.getenv('WEBP_ENCODER_THREADS', '0'))
+    avif_tiles: str = os.getenv('AVIF_TILES', 'auto')
+    cpu_pinning: bool = os.getenv('WEBP_CPU_PINNING', 'false').lower() == 'true'
+
+    # Conversion engine: 'pillow' or 'vips' (pyvips, streams decode->encode
+    # with bounded memory; no SSIM search, classifier or external backends)
+    conversion_engine: str = os.getenv('WEBP_CONVERSION_ENGINE', 'pillow')
+
+    # Background re-optimization of fast encodes when CPU is idle
+    reoptimize_enabled: bool = os.getenv('WEBP_REOPTIMIZE_ENABLED', 'true').lower() == 'true'
+    reoptimize_profile: str = os.getenv('WEBP_REOPTIMIZE_PROFILE', 'max')
+    reoptimize_interval: int = int(os.getenv('WEBP_REOPTIMIZE_INTERVAL', '30'))  # seconds
+    reoptimize_batch: int = int(os.getenv('WEBP_REOPTIMIZE_BATCH', '20'))
+    reoptimize_max_load: float = float(os.getenv('WEBP_REOPTIMIZE_MAX_LOAD', '0.5'))  # load avg per budget CPU
     
     # Format support
     enable_webp: bool = os.getenv('ENABLE_WEBP', 'true').lower() == 'true'
     enable_avif: bool = os.getenv('ENABLE_AVIF', 'true').lower() == 'true'
 
+    # Re-encode campaign: outputs produced with other encoder settings (or
+    # missing a newly enabled format) are re-encoded inside campaign_window
+    # (local HH:MM-HH:MM, empty = any time) while load stays low
+    campaign_enabled: bool = os.getenv('WEBP_CAMPAIGN_ENABLED', 'false').lower() == 'true'
+    campaign_window: str = os.getenv('WEBP_CAMPAIGN_WINDOW', '01:00-06:00')
+    campaign_max_load: float = float(os.getenv('WEBP_CAMPAIGN_MAX_LOAD', '0.7'))  # load avg per budget CPU
+    campaign_cpu_share: float = float(os.getenv('WEBP_CAMPAIGN_CPU_SHARE', '0.5'))  # of one worker
+    campaign_batch: int = int(os.getenv('WEBP_CAMPAIGN_BATCH', '50'))
+    campaign_interval: int = int(os.getenv('WEBP_CAMPAIGN_INTERVAL', '60'))  # seconds
+
+    # AVIF tier: 'eager' encodes AVIF with WebP, 'hot' defers it until
+    # an image gets avif_hot_threshold requests
+    avif_tier: str = os.getenv('WEBP_AVIF_TIER', 'eager')
+    avif_hot_threshold: int = int(os.getenv('WEBP_AVIF_HOT_THRESHOLD', '20'))
+    avif_hot_window: int = int(os.getenv('WEBP_AVIF_HOT_WINDOW', '3600'))  # seconds
+    avif_hot_capacity: int = int(os.getenv('WEBP_AVIF_HOT_CAPACITY', '100000'))  # paths counted
+    avif_hot_source: str = os.getenv('WEBP_AVIF_HOT_SOURCE', 'log')  # log | redis
+    avif_hot_log: str = os.getenv('WEBP_AVIF_HOT_LOG', '/var/log/nginx/cdn.access.log')
+    avif_hot_uri_prefix: str = os.getenv('WEBP_AVIF_HOT_URI_PREFIX', '/upload/resize_cache')
+    avif_hot_redis_url: str = os.getenv('WEBP_AVIF_HOT_REDIS_URL', 'redis://redis:6379/0')
+    avif_hot_redis_prefix: str = os.getenv('WEBP_AVIF_HOT_REDIS_PREFIX', 'hits:')
+    avif_hot_poll_interval: int = int(os.getenv('WEBP_AVIF_HOT_POLL_INTERVAL', '60'))
+    avif_workers: int = int(os.getenv('WEBP_AVIF_WORKERS', '2'))
+    avif_queue_size: int = int(os.getenv('WEBP_AVIF_QUEUE_SIZE', '1000'))
+    avif_nice: int = int(os.getenv('WEBP_AVIF_NICE', '10'))
+
     # Performance
     worker_threads: int = int(os.getenv('WEBP_WORKER_THREADS', '4'))
     batch_size: int = int(os.getenv('WEBP_BATCH_SIZE', '10'))
     scan_interval: int = int(os.getenv('WEBP_SCAN_INTERVAL', '5'))
     max_queue_size: int = int(os.getenv('WEBP_MAX_QUEUE_SIZE', '1000'))
+    # Paths beyond max_queue_size spill to segment files here (empty = puts wait)
+    queue_spill_dir: str = os.getenv('WEBP_QUEUE_SPILL_DIR', '/var/lib/webp/spill')
+    queue_spill_segment: int = int(os.getenv('WEBP_QUEUE_SPILL_SEGMENT', '100000'))  # paths per file
     rate_limit: int = int(os.getenv('WEBP_RATE_LIMIT', '100'))  # files/minute
+    # Watcher events are buffered and moved into the queue in batches
+    watcher_batch_size: int = int(os.getenv('WEBP_WATCHER_BATCH_SIZE', '100'))
+    watcher_buffer_size: int = int(os.getenv('WEBP_WATCHER_BUFFER_SIZE', '10000'))
+
+    # Worker process recycling (0 disables the limit)
+    worker_max_images: int = int(os.getenv('WEBP_WORKER_MAX_IMAGES', '500'))
+    worker_max_rss_mb: int = int(os.getenv('WEBP_WORKER_MAX_RSS_MB', '512'))
 
     # Retry logic
     max_retries: int = 3
@@ -38,6 +149,25 @@ class Config:
     metrics_port: int = int(os.getenv('METRICS_PORT', '9101'))
     health_port: int = int(os.getenv('HEALTH_PORT', '8088'))
 
+    # Admin diagnostics on the health port under /debug/ (profiler,
+    # tracemalloc, event-loop lag) - off means no routes and no overhead
+    debug_endpoints: bool = os.getenv('WEBP_DEBUG_ENDPOINTS', 'false').lower() == 'true'
+
+    # Log per-stage breakdown of files taking longer than this (0 disables)
+    slow_file_seconds: float = float(os.getenv('WEBP_SLOW_FILE_SECONDS', '30'))
+
+    # Heavy-hitter directories: cut to this many levels below watch_dir,
+    # tracked in a table of heavy_hitters_capacity, top_directories exported as gauges
+    heavy_hitters_depth: int = int(os.getenv('WEBP_HEAVY_HITTERS_DEPTH', '3'))
+    heavy_hitters_capacity: int = int(os.getenv('WEBP_HEAVY_HITTERS_CAPACITY', '200'))
+    top_directories: int = int(os.getenv('WEBP_TOP_DIRECTORIES', '10'))
+
+    # State
+    state_db: str = os.getenv('WEBP_STATE_DB', '/var/lib/webp/state.db')
+    # Offline bulk runs (python -m app convert) keep their own database
+    bulk_state_db: str = os.getenv('WEBP_BULK_STATE_DB',
+                                   os.path.expanduser('~/.local/state/webp-converter/bulk.db'))
+
     # Logging
     log_level: str = os.getenv('LOG_LEVEL', 'INFO')
     log_file: str = '/var/log/webp/converter.log'
@@ -60,7 +190,12 @@ class Config:
                     if hasattr(self, key):
                         setattr(self, key, value)
 
+        # Per-format backend env vars win over the encoder_backends mapping
+        for fmt, env in (('webp', 'WEBP_ENCODER_BACKEND'), ('avif', 'AVIF_ENCODER_BACKEND')):
+            if os.getenv(env):
+                self.encoder_backends = {**self.encoder_backends, fmt: os.getenv(env)}
+
         # Parse extensions
         if not self.extensions:
-            ext_str = os.getenv('WEBP_EXTENSIONS', 'jpg,jpeg,png')
+            ext_str = os.getenv('WEBP_EXTENSIONS', 'jpg,jpeg,png,gif')
             self.extensions = [ext.strip() for ext in ext_str.split(',')]
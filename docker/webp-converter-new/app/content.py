@@ -0,0 +1,85 @@
+"""
+Content classification: lossless vs lossy and alpha handling
+"""
+from PIL import Image
+
+# NumPy is needed for the classifier only
+try:
+    import numpy as np
+    CLASSIFY_SUPPORT = True
+except ImportError:
+    CLASSIFY_SUPPORT = False
+
+# Pixels sampled for color count and entropy
+SAMPLE_PIXELS = 512 * 512
+
+def _has_alpha(img: Image.Image) -> bool:
+    """Image mode or palette carries transparency"""
+    return img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+
+def _sample(arr):
+    """Strided sample of a H x W (x C) array"""
+    step = max(1, int((arr.shape[0] * arr.shape[1] / SAMPLE_PIXELS) ** 0.5))
+    return arr[::step, ::step]
+
+def classify(img: Image.Image, config):
+    """Classify image content and normalize its mode.
+
+    Returns converted image and decision: content class ('photo',
+    'graphic', with '_alpha' suffix when transparency is kept), whether
+    an opaque alpha plane was dropped and whether alpha is binary.
+    """
+    alpha_kept = _has_alpha(img)
+    img = img.convert('RGBA' if alpha_kept else 'RGB')
+
+    alpha_dropped = False
+    alpha_binary = False
+    if alpha_kept:
+        alpha = np.asarray(img.getchannel('A'))
+        if alpha.min() == 255:
+            # Fully opaque - alpha plane is dead weight
+            img = img.convert('RGB')
+            alpha_kept = False
+            alpha_dropped = True
+        else:
+            alpha_binary = not np.any((alpha > 0) & (alpha < 255))
+
+    rgb = _sample(np.asarray(img)[..., :3]).astype(np.uint32)
+    packed = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+    colors = len(np.unique(packed))
+
+    # Shannon entropy of the luma histogram, bits per pixel
+    luma = (rgb[..., 0] * 299 + rgb[..., 1] * 587 + rgb[..., 2] * 114) // 1000
+    hist = np.bincount(luma.ravel(), minlength=256)
+    p = hist[hist > 0] / luma.size
+    entropy = float(-(p * np.log2(p)).sum())
+
+    lossless = (colors <= config.lossless_max_colors
+                or entropy <= config.lossless_max_entropy)
+    content_class = 'graphic' if lossless else 'photo'
+    if alpha_kept:
+        content_class += '_alpha'
+
+    return img, {
+        'class': content_class,
+        'lossless': lossless,
+        'alpha_dropped': alpha_dropped,
+        'alpha_binary': alpha_binary,
+        'colors': colors,
+        'entropy': entropy,
+    }
+
+def content_options(fmt: str, content: dict, config) -> dict:
+    """Encoder option overrides for classified content"""
+    options = dict(content.get('metadata_options', {}))
+    if fmt != 'webp':
+        # AVIF gets the alpha handling only
+        return options
+
+    if content['lossless']:
+        options['lossless'] = True
+    elif content['class'] == 'photo_alpha':
+        # Binary masks are cheap to keep exact, soft edges tolerate loss
+        options['alpha_quality'] = 100 if content.get('alpha_binary') else config.webp_alpha_quality
+
+    return options
@@ -1,37 +1,284 @@
 """
 Async image conversion to WebP and AVIF formats
 """
+import io
 import os
+import json
+import time
 import asyncio
+import hashlib
 from pathlib import Path
 from PIL import Image
 from app.metrics import metrics
+from app.encoders import get_backend
+from app.quality import SSIM_SUPPORT, search_quality
+from app.content import CLASSIFY_SUPPORT, classify, content_options
+from app.metadata import apply_metadata_policy, oriented_size
+from app.animation import is_animated, convert_animation
+from app.resize import max_side_for, draft, downscale, resize_step, variant_path, variant_width
+from app.vips_engine import VIPS_SUPPORT, convert_vips_sync
+from app.worker_pool import WorkerProcess
+from app.cpu_layout import encoder_threads, avif_tiling
 import structlog
 
-# AVIF support via pillow-heif
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-    AVIF_SUPPORT = True
-except ImportError:
-    AVIF_SUPPORT = False
-
 logger = structlog.get_logger()
 
+def encoder_options(fmt: str, config, profile: str) -> dict:
+    """Pillow save options for format and encoder profile"""
+    settings = config.encoder_profiles[profile]
+    if fmt == 'webp':
+        return {'quality': config.webp_quality, 'method': settings['webp_method']}
+    if fmt == 'jpeg':
+        return {'quality': config.jpeg_quality}
+    options = {'quality': config.avif_quality, 'speed': settings['avif_speed'],
+               **avif_tiling(config)}
+    if encoder_threads():
+        options['max_threads'] = encoder_threads()
+    return options
+
+def set_permissions(path: Path):
+    """www-data ownership, world-readable"""
+    try:
+        os.chown(path, 33, 33)  # www-data
+    except PermissionError:
+        # Offline runs as an unprivileged user keep their own ownership
+        pass
+    os.chmod(path, 0o644)
+
+def settings_fingerprint(fmt: str, config) -> str:
+    """Short hash of the settings that shape a format's output.
+
+    The speed profile is left out - re-optimization changes it on purpose.
+    """
+    settings = {
+        'quality': getattr(config, f'{fmt}_quality'),
+        'engine': config.conversion_engine,
+        'backend': config.encoder_backends.get(fmt, 'pillow'),
+        'metadata': [config.strip_metadata, config.icc_policy],
+        'max_dimensions': config.max_dimensions,
+    }
+    if config.quality_mode == 'ssim':
+        settings['ssim'] = [config.ssim_target, config.ssim_min_quality, config.ssim_max_quality]
+    if config.content_aware:
+        settings['content'] = [config.lossless_max_colors, config.lossless_max_entropy,
+                               config.webp_alpha_quality]
+    if fmt == 'avif':
+        settings['tiles'] = config.avif_tiles
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+def normalize_image(img: Image.Image, config):
+    """Apply metadata policy, classify content and convert to RGB/RGBA.
+
+    Returns image and decision, including explicit metadata encoder options.
+    """
+    source_format = img.format
+    img, metadata_options, metadata = apply_metadata_policy(img, config)
+
+    if config.content_aware and CLASSIFY_SUPPORT and source_format != 'JPEG':
+        img, content = classify(img, config)
+    else:
+        content = {'class': 'photo', 'lossless': False, 'alpha_dropped': False}
+        # Convert to RGB if necessary
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            content['class'] = 'photo_alpha'
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+    content['metadata_options'] = metadata_options
+    content['metadata'] = metadata
+    return img, content
+
+def encode_image(img: Image.Image, fmt: str, options: dict, config):
+    """Encode prepared image with the configured backend,
+    returns output bytes and target-quality search stats if used"""
+    backend = get_backend(fmt, config)
+
+    if (config.quality_mode == 'ssim' and SSIM_SUPPORT
+            and not options.get('lossless')):
+        return search_quality(
+            img, options, config,
+            lambda trial_options: backend.encode(img, fmt, trial_options, config)
+        )
+
+    return backend.encode(img, fmt, options, config), {}
+
+def cpu_time() -> float:
+    """CPU seconds of this process, its threads and reaped encoder subprocesses"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def temp_path(path) -> Path:
+    """Hidden sibling of path for an atomic replace, unique per process"""
+    path = Path(path)
+    return path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+
+def write_atomic(path, data: bytes):
+    """Write data so readers (nginx) see the old or the new file, never a partial one"""
+    tmp_path = temp_path(path)
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+def convert_sync(original_path: Path, output_path: Path, fmt: str, config, profile: str,
+                 width: int = None) -> dict:
+    """Synchronous conversion (runs in worker process), returns encode stats
+    with per-stage timings and CPU time in seconds. With width, a single
+    responsive variant of that width is encoded instead.
+
+    The output is written next to output_path and moved into place, as it
+    may be served while being replaced.
+    """
+    tmp_path = temp_path(output_path)
+    try:
+        stats = _convert_sync(original_path, tmp_path, fmt, config, profile, width)
+        if tmp_path.exists():
+            os.replace(tmp_path, output_path)
+        return stats
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+def _convert_sync(original_path: Path, output_path: Path, fmt: str, config, profile: str,
+                  width: int = None) -> dict:
+    timings = {}
+    cpu_start = cpu_time()
+    mark = time.perf_counter()
+
+    def stage(name):
+        nonlocal mark
+        now = time.perf_counter()
+        timings[name] = now - mark
+        mark = now
+
+    vips = config.conversion_engine == 'vips' and VIPS_SUPPORT and not width
+    # Read the whole file up front, so read is file I/O and decode is CPU only.
+    # libvips streams from the path itself - Pillow reads just the header then.
+    source = original_path if vips else io.BytesIO(Path(original_path).read_bytes())
+    with Image.open(source) as img:
+        stage('read')
+        if is_animated(img):
+            stats = convert_animation(img, output_path, fmt,
+                                      encoder_options(fmt, config, profile), config)
+            stage('encode')
+            return {**stats, 'timings': timings, 'cpu_seconds': cpu_time() - cpu_start}
+
+        if vips:
+            stats = convert_vips_sync(original_path, output_path, fmt,
+                                      encoder_options(fmt, config, profile), config)
+            # Decode and write are fused into the streaming encode
+            stage('encode')
+            return {**stats, 'timings': timings, 'cpu_seconds': cpu_time() - cpu_start}
+
+        original_size = oriented_size(img)
+
+        # Decode oversized JPEGs (or the source of a variant) at reduced scale
+        max_side = max_side_for(original_path, config)
+        decode_side = max_side
+        if width:
+            variant_side = max(width, round(width * original_size[1] / original_size[0]))
+            decode_side = min(decode_side or variant_side, variant_side)
+        if decode_side:
+            draft(img, decode_side)
+        # PNG metadata may follow the pixel data, so oriented_size can decode too
+        img.load()
+        stage('decode')
+
+        img, content = normalize_image(img, config)
+        stage('normalize')
+        if max_side:
+            img = downscale(img, max_side)
+            stage('resize')
+        if width and width < img.width:
+            img = resize_step(img, width)
+            stage('resize')
+
+        options = encoder_options(fmt, config, profile)
+        options.update(content_options(fmt, content, config))
+
+        stats = {'content_class': content['class'],
+                 'alpha_dropped': content['alpha_dropped'],
+                 'downscaled': img.size != original_size,
+                 **content['metadata']}
+        data, search_stats = encode_image(img, fmt, options, config)
+        stats.update(search_stats)
+        stage('encode')
+        Path(output_path).write_bytes(data)
+        stage('write')
+        return {**stats, 'timings': timings, 'cpu_seconds': cpu_time() - cpu_start}
+
+def generate_variants_sync(original_path: Path, formats, widths, config, profile: str) -> dict:
+    """Width ladder in every format from one decode (runs in worker process).
+
+    Each step is resized from the previous, larger one. Returns produced
+    and skipped (not narrower than the original) widths with stage timings.
+    """
+    timings = {'decode': 0.0, 'resize': 0.0}
+    cpu_start = cpu_time()
+    start = time.perf_counter()
+
+    with Image.open(original_path) as img:
+        if is_animated(img):
+            # No width ladder for animations
+            return {'widths': [], 'skipped': list(widths), 'timings': timings}
+
+        width, height = oriented_size(img)
+        skipped = [w for w in widths if w >= width]
+        widths = sorted((w for w in widths if w < width), reverse=True)
+        if not widths:
+            return {'widths': [], 'skipped': skipped, 'timings': timings}
+
+        # Decode JPEG at the smallest DCT scale still covering the widest variant
+        draft(img, max(widths[0], round(widths[0] * height / width)))
+        img.load()
+        current, content = normalize_image(img, config)
+        timings['decode'] = time.perf_counter() - start
+
+        for width in widths:
+            step_start = time.perf_counter()
+            current = resize_step(current, width)
+            timings['resize'] += time.perf_counter() - step_start
+
+            for fmt in formats:
+                step_start = time.perf_counter()
+                options = encoder_options(fmt, config, profile)
+                options.update(content_options(fmt, content, config))
+                data, _ = encode_image(current, fmt, options, config)
+                write_atomic(variant_path(original_path, width, fmt), data)
+                stage = f'encode_{fmt}'
+                timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - step_start
+
+    return {'widths': widths, 'skipped': skipped, 'timings': timings,
+            'cpu_seconds': cpu_time() - cpu_start}
+
 class ImageConverter:
-    def __init__(self, config, queue_manager):
+    def __init__(self, config, queue_manager, state, lane='main',
+                 formats=('webp', 'avif'), worker_count=None, nice=0, layout=None,
+                 directories=None):
         self.config = config
         self.queue = queue_manager
+        self.state = state
+        self.lane = lane
+        self.formats = formats
+        self.worker_count = worker_count or config.worker_threads
+        self.nice = nice
+        self.layout = layout
+        self.directories = directories
         self.running = True
         self.workers = []
+        self.processes = {}
 
     async def start(self):
         """Start worker threads for queue processing"""
         logger.info("Starting image converter workers",
-                   workers=self.config.worker_threads)
+                   lane=self.lane,
+                   formats=list(self.formats),
+                   workers=self.worker_count)
 
-        for i in range(self.config.worker_threads):
-            worker = asyncio.create_task(self._worker(i))
+        for i in range(self.worker_count):
+            worker_id = i if self.lane == 'main' else f'{self.lane}-{i}'
+            worker = asyncio.create_task(self._worker(worker_id))
             self.workers.append(worker)
 
         await asyncio.gather(*self.workers, return_exceptions=True)
@@ -39,30 +286,44 @@ class ImageConverter:
     async def _worker(self, worker_id):
         """Worker to process files from queue"""
         logger.info("Worker started", worker_id=worker_id)
+        process = WorkerProcess(worker_id, self.config, self.nice, self.layout)
+        self.processes[worker_id] = process
 
         while self.running:
             try:
                 file_path = await self.queue.get()
                 if file_path is None:
+                    # Stop sentinel - account for it so the queue can still be joined
+                    self.queue.task_done()
                     break
 
                 await self._process_file(file_path, worker_id)
                 self.queue.task_done()
+                await process.maybe_recycle()
 
             except Exception as e:
                 logger.error("Worker error", worker_id=worker_id, error=str(e))
                 await asyncio.sleep(self.config.retry_delay)
 
+        await process.stop()
+
     async def _process_file(self, file_path, worker_id):
         """Process single file"""
         start_time = asyncio.get_event_loop().time()
+        trace = {}
+        queue_wait = self.queue.waited(str(file_path))
+        if queue_wait is not None:
+            self._trace(trace, 'queue_wait', queue_wait)
         try:
             file_path = Path(file_path)
             webp_path = file_path.with_suffix('.webp')
             avif_path = file_path.with_suffix('.avif')
 
             # Validate file before processing
-            if not await self._validate_file(file_path):
+            validate_start = time.perf_counter()
+            valid = await self._validate_file(file_path)
+            self._trace(trace, 'validate', time.perf_counter() - validate_start)
+            if not valid:
                 logger.warning("Skipping invalid file", file=str(file_path))
                 duration = asyncio.get_event_loop().time() - start_time
                 self.queue.mark_completed(worker_id, str(file_path.name), 'invalid', duration)
@@ -72,11 +333,17 @@ class ImageConverter:
             self.queue.mark_processing(worker_id, str(file_path.name))
 
             # Check if WebP conversion needed
-            webp_needed = self.config.enable_webp and self._should_convert(file_path, webp_path)
-            # Check if AVIF conversion needed
-            avif_needed = self.config.enable_avif and self._should_convert(file_path, avif_path)
-
-            if not webp_needed and not avif_needed:
+            webp_needed = ('webp' in self.formats and self.config.enable_webp
+                           and self._should_convert(file_path, webp_path))
+            # Check if AVIF conversion needed. Outside the AVIF lane an existing
+            # AVIF is still refreshed when the original changes, so it never goes stale.
+            avif_needed = (('avif' in self.formats or avif_path.exists())
+                           and self.config.enable_avif
+                           and self._should_convert(file_path, avif_path))
+            # Responsive width variants missing or stale
+            variant_widths = self._variant_widths_needed(file_path)
+
+            if not webp_needed and not avif_needed and not variant_widths:
                 metrics.images_skipped.inc()
                 logger.debug("Skipping file", file=str(file_path),
                            reason="both formats exist and newer or disabled")
@@ -88,7 +355,7 @@ class ImageConverter:
             if webp_needed:
                 for attempt in range(self.config.max_retries):
                     try:
-                        await self._convert_to_webp(file_path, webp_path, worker_id)
+                        await self._convert_to_webp(file_path, webp_path, worker_id, trace)
                         break
                     except Exception as e:
                         if attempt == self.config.max_retries - 1:
@@ -103,7 +370,7 @@ class ImageConverter:
             if avif_needed:
                 for attempt in range(self.config.max_retries):
                     try:
-                        await self._convert_to_avif(file_path, avif_path, worker_id)
+                        await self._convert_to_avif(file_path, avif_path, worker_id, trace)
                         break
                     except Exception as e:
                         if attempt == self.config.max_retries - 1:
@@ -114,6 +381,12 @@ class ImageConverter:
                                      error=str(e))
                         await asyncio.sleep(self.config.retry_delay)
 
+            if variant_widths:
+                variants_start = time.perf_counter()
+                await self._generate_variants(file_path, variant_widths, worker_id, trace)
+                # Stages already go to webp_variant_stage_duration_seconds
+                trace['variants'] = time.perf_counter() - variants_start
+
             duration = asyncio.get_event_loop().time() - start_time
             self.queue.mark_completed(worker_id, str(file_path.name), 'success', duration)
 
@@ -125,6 +398,126 @@ class ImageConverter:
                         file=str(file_path),
                         error=str(e))
 
+        finally:
+            cpu_seconds = trace.pop('cpu', 0.0)
+            self._check_slow(file_path, worker_id, trace, cpu_seconds,
+                             asyncio.get_event_loop().time() - start_time)
+            if self.directories and cpu_seconds:
+                self._attribute(file_path, cpu_seconds)
+
+    def _attribute(self, file_path, cpu_seconds: float):
+        """Charge a converted file to its directory"""
+        try:
+            size = Path(file_path).stat().st_size
+        except OSError:
+            size = 0
+        self.directories.record(file_path, size, cpu_seconds)
+
+    def _observe_freshness(self, fmt: str, original_path: Path, output_path: Path):
+        """Export lag from the original's mtime until its output is in place"""
+        try:
+            source_mtime = original_path.stat().st_mtime
+            if output_path.stat().st_mtime < source_mtime:
+                return
+        except OSError:
+            # Pruned or left unconverted - nothing was put in place
+            return
+        metrics.freshness.labels(format=fmt, lane=self.lane).observe(time.time() - source_mtime)
+
+    def _trace(self, trace, stage: str, seconds: float):
+        """Export stage time and add it to the file's trace"""
+        metrics.stage_duration.labels(stage=stage).observe(seconds)
+        if trace is not None:
+            trace[stage] = trace.get(stage, 0.0) + seconds
+
+    def _trace_conversion(self, fmt: str, stats: dict, trace):
+        """Export worker-side stage timings of one conversion"""
+        for stage, seconds in stats.get('timings', {}).items():
+            self._trace(trace, f'encode_{fmt}' if stage == 'encode' else stage, seconds)
+        self._trace_cpu(stats, trace)
+
+    @staticmethod
+    def _trace_cpu(stats: dict, trace):
+        """Add worker CPU time to the file's trace (not a stage, popped before logging)"""
+        if trace is not None:
+            trace['cpu'] = trace.get('cpu', 0.0) + stats.get('cpu_seconds', 0.0)
+
+    def _check_slow(self, file_path, worker_id, trace: dict, cpu_seconds: float,
+                    duration: float):
+        """Log stage breakdown of a file slower than slow_file_seconds.
+
+        Queue wait is reported but not counted - a backlog does not make a file slow.
+        """
+        threshold = self.config.slow_file_seconds
+        if not threshold or duration < threshold:
+            return
+
+        metrics.slow_files.inc()
+        logger.warning("Slow file",
+                      worker_id=worker_id,
+                      file=str(file_path),
+                      duration=f"{duration:.2f}s",
+                      cpu=f"{cpu_seconds:.2f}s",
+                      stages={stage: round(seconds, 3) for stage, seconds in trace.items()})
+
+    def _variant_formats(self):
+        """Enabled formats handled by this lane"""
+        return [fmt for fmt in self.formats if getattr(self.config, f'enable_{fmt}')]
+
+    def _variant_widths_needed(self, file_path: Path):
+        """Ladder widths with a missing or stale variant in any format"""
+        return [width for width in self.config.responsive_widths
+                if any(self._should_convert(file_path, variant_path(file_path, width, fmt))
+                       for fmt in self._variant_formats())]
+
+    async def _generate_variants(self, file_path: Path, widths, worker_id, trace=None,
+                                 fresh: bool = True):
+        """Generate responsive width variants from one decode"""
+        formats = self._variant_formats()
+        start_time = asyncio.get_event_loop().time()
+        result = await self.processes[worker_id].run(
+            generate_variants_sync, file_path, formats, widths,
+            self.config, self.config.encode_profile
+        )
+
+        source_mtime = file_path.stat().st_mtime
+        for width in result['widths']:
+            for fmt in formats:
+                output_path = variant_path(file_path, width, fmt)
+                set_permissions(output_path)
+                # Tagged like primary outputs, so re-optimization upgrades them too
+                self.state.record(output_path, file_path, fmt,
+                                  profile=self.config.encode_profile,
+                                  size=output_path.stat().st_size, pruned=0, reoptimized=None,
+                                  source_mtime=source_mtime,
+                                  settings=settings_fingerprint(fmt, self.config))
+                metrics.variants_generated.labels(format=fmt).inc()
+        if fresh and result['widths']:
+            # Narrowest variant is written last
+            for fmt in formats:
+                self._observe_freshness(f'{fmt}_variants', file_path,
+                                        variant_path(file_path, result['widths'][-1], fmt))
+
+        # Not narrower than the original - remember so it is not retried
+        for width in result['skipped']:
+            for fmt in formats:
+                self.state.record(variant_path(file_path, width, fmt), file_path, fmt,
+                                  profile=None, size=0, pruned=1, source_mtime=source_mtime,
+                                  settings=settings_fingerprint(fmt, self.config))
+
+        for stage, seconds in result['timings'].items():
+            metrics.variant_stage_duration.labels(stage=stage).observe(seconds)
+        self._trace_cpu(result, trace)
+        duration = asyncio.get_event_loop().time() - start_time
+        metrics.variant_duration.observe(duration)
+
+        logger.info("Responsive variants generated",
+                   worker_id=worker_id,
+                   file=str(file_path.name),
+                   widths=result['widths'],
+                   formats=formats,
+                   duration=f"{duration:.2f}s")
+
     def _should_convert(self, original_path: Path, webp_path: Path) -> bool:
         """Check if conversion is needed"""
         if self.config.force_reconvert:
@@ -141,7 +534,104 @@ class ImageConverter:
         if webp_path.exists():
             if webp_path.stat().st_mtime >= original_path.stat().st_mtime:
                 return False
+        elif self._is_pruned(original_path, webp_path):
+            return False
+
+        return True
+
+    def _record_encode_stats(self, fmt: str, stats: dict, original_size: int, output_size: int):
+        """Export content class and target-quality search stats"""
+        content_class = stats.get('content_class', 'photo')
+        metrics.class_images.labels(format=fmt, content_class=content_class).inc()
+        metrics.class_original_bytes.labels(format=fmt, content_class=content_class).inc(original_size)
+        metrics.class_output_bytes.labels(format=fmt, content_class=content_class).inc(output_size)
+        if stats.get('alpha_dropped'):
+            metrics.alpha_dropped.labels(format=fmt).inc()
+        if stats.get('downscaled'):
+            metrics.downscaled.labels(format=fmt).inc()
+        for kind, size in stats.get('removed', {}).items():
+            metrics.metadata_removed_bytes.labels(format=fmt, kind=kind).inc(size)
+        if stats.get('orientation_applied'):
+            metrics.orientation_applied.labels(format=fmt).inc()
+        if stats.get('frames'):
+            metrics.animated_frames.labels(format=fmt).inc(stats['frames'])
+
+        if not stats.get('trials'):
+            return
+
+        metrics.ssim_images.labels(format=fmt).inc()
+        metrics.ssim_trials.labels(format=fmt).inc(stats['trials'])
+        metrics.ssim_quality.labels(format=fmt).observe(stats['quality'])
+        metrics.ssim_baseline_bytes.labels(format=fmt).inc(stats['baseline_size'])
+        metrics.ssim_output_bytes.labels(format=fmt).inc(stats['size'])
+        metrics.ssim_extra_cpu.labels(format=fmt).inc(stats['extra_cpu'])
+
+    def _record_sizes(self, fmt: str, original_path: Path, original_size: int, output_size: int):
+        """Export size histograms and byte counters per format and source extension"""
+        extension = original_path.suffix.lower().lstrip('.')
+        metrics.original_size.labels(format=fmt, extension=extension).observe(original_size)
+        getattr(metrics, f'{fmt}_size').labels(extension=extension).observe(output_size)
+        metrics.input_bytes.labels(format=fmt, extension=extension).inc(original_size)
+        metrics.output_bytes.labels(format=fmt, extension=extension).inc(output_size)
+        # Counters cannot go down - an output larger than its original saves nothing
+        metrics.saved_bytes.labels(format=fmt, extension=extension).inc(
+            max(0, original_size - output_size))
+
+    def _not_converted(self, original_path: Path, output_path: Path, fmt: str, stats: dict) -> bool:
+        """Record animation left as is (over budget), so it is not retried"""
+        reason = stats.get('skip_reason')
+        if not reason:
+            return False
+
+        self.state.record(output_path, original_path, fmt,
+                          profile=None, size=0, pruned=1,
+                          source_mtime=original_path.stat().st_mtime,
+                          settings=settings_fingerprint(fmt, self.config))
+        metrics.animated_skipped.labels(reason=reason).inc()
+        logger.info("Animation not converted",
+                   file=str(original_path.name),
+                   format=fmt,
+                   frames=stats.get('frames'),
+                   reason=reason)
+        return True
+
+    def _is_pruned(self, original_path: Path, output_path: Path) -> bool:
+        """Variant was discarded for the current version of the original"""
+        return self.state.is_pruned(output_path, original_path.stat().st_mtime)
+
+    def _prune_unprofitable(self, original_path: Path, output_path: Path, fmt: str,
+                            output_size: int) -> bool:
+        """Discard variant that is not enough smaller than what nginx would serve instead"""
+        if not self.config.prune_variants:
+            return False
 
+        # Without this variant nginx serves the WebP (for AVIF) or the original
+        baseline = original_path.stat().st_size
+        min_savings = self.config.webp_min_savings
+        if fmt == 'avif':
+            min_savings = self.config.avif_min_savings
+            webp_path = original_path.with_suffix('.webp')
+            if webp_path.exists():
+                baseline = min(baseline, webp_path.stat().st_size)
+
+        savings = (1 - output_size / baseline) * 100
+        if savings >= min_savings:
+            return False
+
+        output_path.unlink(missing_ok=True)
+        self.state.record(output_path, original_path, fmt,
+                          profile=None, size=0, pruned=1,
+                          source_mtime=original_path.stat().st_mtime,
+                          settings=settings_fingerprint(fmt, self.config))
+        metrics.variants_pruned.labels(format=fmt).inc()
+        metrics.pruned_bytes.labels(format=fmt).inc(output_size)
+
+        logger.info("Variant pruned",
+                   file=str(original_path.name),
+                   format=fmt,
+                   size=output_size,
+                   baseline_size=baseline,
+                   savings=f"{savings:.1f}%")
         return True
 
     async def _validate_file(self, file_path: Path) -> bool:
@@ -167,28 +657,48 @@ class ImageConverter:
         except Exception:
             return False
 
-    async def _convert_to_webp(self, original_path: Path, webp_path: Path, worker_id: int):
+    async def _convert_to_webp(self, original_path: Path, webp_path: Path, worker_id: int,
+                               trace=None, fresh: bool = True):
         """Convert image to WebP"""
         start_time = asyncio.get_event_loop().time()
 
-        # Convert in thread pool
-        await asyncio.to_thread(self._convert_sync, original_path, webp_path)
+        # Convert in worker process
+        profile = self.config.encode_profile
+        stats = await self.processes[worker_id].run(
+            convert_sync, original_path, webp_path, 'webp', self.config, profile
+        )
+        self._trace_conversion('webp', stats, trace)
+        finalize_start = time.perf_counter()
+        if self._not_converted(original_path, webp_path, 'webp', stats):
+            return
 
         # Set permissions
-        os.chown(webp_path, 33, 33)  # www-data
-        os.chmod(webp_path, 0o644)
+        set_permissions(webp_path)
 
         # Metrics
         duration = asyncio.get_event_loop().time() - start_time
         original_size = original_path.stat().st_size
         webp_size = webp_path.stat().st_size
         compression_ratio = (1 - webp_size / original_size) * 100
+        self._record_encode_stats('webp', stats, original_size, webp_size)
+
+        if self._prune_unprofitable(original_path, webp_path, 'webp', webp_size):
+            metrics.conversion_duration.observe(duration)
+            self._trace(trace, 'finalize', time.perf_counter() - finalize_start)
+            return
 
         metrics.images_converted.inc()
         metrics.conversion_duration.observe(duration)
-        metrics.original_size.observe(original_size)
-        metrics.webp_size.observe(webp_size)
+        self._record_sizes('webp', original_path, original_size, webp_size)
         metrics.compression_ratio.set(compression_ratio)
+        self.state.record(webp_path, original_path, 'webp',
+                          profile=profile, size=webp_size, pruned=0, reoptimized=None,
+                          source_mtime=original_path.stat().st_mtime,
+                          settings=settings_fingerprint('webp', self.config))
+        if fresh:
+            # Served from here on, whatever else this file still needs
+            self._observe_freshness('webp', original_path, webp_path)
+        self._trace(trace, 'finalize', time.perf_counter() - finalize_start)
 
         logger.info("Image converted",
                    worker_id=worker_id,
@@ -198,28 +708,48 @@ class ImageConverter:
                    compression=f"{compression_ratio:.1f}%",
                    duration=f"{duration:.2f}s")
 
-    async def _convert_to_avif(self, original_path: Path, avif_path: Path, worker_id: int):
+    async def _convert_to_avif(self, original_path: Path, avif_path: Path, worker_id: int,
+                               trace=None, fresh: bool = True):
         """Convert image to AVIF"""
         start_time = asyncio.get_event_loop().time()
 
-        # Convert in thread pool
-        await asyncio.to_thread(self._convert_avif_sync, original_path, avif_path)
+        # Convert in worker process
+        profile = self.config.encode_profile
+        stats = await self.processes[worker_id].run(
+            convert_sync, original_path, avif_path, 'avif', self.config, profile
+        )
+        self._trace_conversion('avif', stats, trace)
+        finalize_start = time.perf_counter()
+        if self._not_converted(original_path, avif_path, 'avif', stats):
+            return
 
         # Set permissions
-        os.chown(avif_path, 33, 33)  # www-data
-        os.chmod(avif_path, 0o644)
+        set_permissions(avif_path)
 
         # Metrics
         duration = asyncio.get_event_loop().time() - start_time
         original_size = original_path.stat().st_size
         avif_size = avif_path.stat().st_size
         compression_ratio = (1 - avif_size / original_size) * 100
+        self._record_encode_stats('avif', stats, original_size, avif_size)
+
+        if self._prune_unprofitable(original_path, avif_path, 'avif', avif_size):
+            metrics.avif_conversion_duration.observe(duration)
+            self._trace(trace, 'finalize', time.perf_counter() - finalize_start)
+            return
 
         metrics.avif_images_converted.inc()
         metrics.avif_conversion_duration.observe(duration)
-        metrics.original_size.observe(original_size)
-        metrics.avif_size.observe(avif_size)
+        self._record_sizes('avif', original_path, original_size, avif_size)
         metrics.avif_compression_ratio.set(compression_ratio)
+        self.state.record(avif_path, original_path, 'avif',
+                          profile=profile, size=avif_size, pruned=0, reoptimized=None,
+                          source_mtime=original_path.stat().st_mtime,
+                          settings=settings_fingerprint('avif', self.config))
+        if fresh:
+            # Served from here on, whatever else this file still needs
+            self._observe_freshness('avif', original_path, avif_path)
+        self._trace(trace, 'finalize', time.perf_counter() - finalize_start)
 
         logger.info("Image converted to AVIF",
                    worker_id=worker_id,
@@ -229,47 +759,86 @@ class ImageConverter:
                    compression=f"{compression_ratio:.1f}%",
                    duration=f"{duration:.2f}s")
 
-    def _convert_sync(self, original_path: Path, webp_path: Path):
-        """Synchronous WebP conversion (runs in thread pool)"""
-        with Image.open(original_path) as img:
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGBA')
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            # Save as WebP
-            img.save(webp_path,
-                    'WEBP',
-                    quality=self.config.webp_quality,
-                    method=6)  # Maximum compression
-
-    def _convert_avif_sync(self, original_path: Path, avif_path: Path):
-        """Synchronous AVIF conversion (runs in thread pool)"""
-        if not AVIF_SUPPORT:
-            raise RuntimeError("AVIF support not available - pillow-heif not installed")
-            
-        with Image.open(original_path) as img:
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGBA')
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            # Save as AVIF using pillow-heif
-            img.save(avif_path,
-                    'AVIF',
-                    quality=self.config.avif_quality,
-                    method=6)  # Maximum compression
+    async def reencode(self, source_path: Path, output_path: Path, fmt: str,
+                       profile: str, worker_id):
+        """Re-encode existing output with another profile, keep smaller file.
+
+        An output made with other settings is replaced even if it grows,
+        otherwise the old settings would stay in place unnoticed.
+        """
+        if (not source_path.exists() or not output_path.exists()
+                or output_path.stat().st_mtime < source_path.stat().st_mtime):
+            # Stale or gone - the regular pipeline takes care of it
+            self.state.forget(output_path)
+            return
+
+        record = self.state.get(output_path) or {}
+        settings = settings_fingerprint(fmt, self.config)
+        start_time = asyncio.get_event_loop().time()
+        tmp_path = output_path.with_name(output_path.name + '.tmp')
+        try:
+            await self.processes[worker_id].run(
+                convert_sync, source_path, tmp_path, fmt, self.config, profile,
+                variant_width(source_path, output_path)
+            )
+            old_size = output_path.stat().st_size
+            new_size = tmp_path.stat().st_size
+
+            replaced = new_size < old_size or record.get('settings') != settings
+            if replaced:
+                set_permissions(tmp_path)
+                os.replace(tmp_path, output_path)
+                metrics.reoptimize_saved_bytes.labels(format=fmt).inc(max(0, old_size - new_size))
+            else:
+                new_size = old_size
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+        if replaced:
+            self.state.record(output_path, source_path, fmt, profile=profile, size=new_size,
+                              settings=settings, reoptimized=profile)
+        else:
+            # The kept file is still what its previous profile produced
+            self.state.record(output_path, source_path, fmt, profile=record.get('profile'),
+                              size=new_size, settings=record.get('settings'),
+                              reoptimized=profile)
+        metrics.reoptimized.labels(format=fmt).inc()
+
+        logger.debug("Output re-encoded",
+                    file=str(output_path.name),
+                    profile=profile,
+                    old_size=old_size,
+                    new_size=new_size,
+                    duration=f"{asyncio.get_event_loop().time() - start_time:.2f}s")
+
+    async def refresh(self, source_path: Path, formats, worker_id):
+        """Re-encode source to formats with current settings, width variants included"""
+        if not source_path.exists():
+            for fmt in formats:
+                self.state.forget(source_path.with_suffix(f'.{fmt}'))
+            return
+
+        for fmt in formats:
+            output_path = source_path.with_suffix(f'.{fmt}')
+            # Re-encodes of unchanged originals would skew the freshness SLO
+            if fmt == 'webp':
+                await self._convert_to_webp(source_path, output_path, worker_id, fresh=False)
+            else:
+                await self._convert_to_avif(source_path, output_path, worker_id, fresh=False)
+
+        if self.config.responsive_widths:
+            await self._generate_variants(source_path, self.config.responsive_widths, worker_id,
+                                          fresh=False)
 
     async def stop(self):
         """Stop workers"""
         logger.info("Stopping image converter workers")
         self.running = False
 
-        # Signal stop to all workers
-        for _ in self.workers:
-            await self.queue.put(None)
+        # Wake idle workers, busy ones stop after their current file.
+        # Items still queued are left to the queue's close()
+        self.queue.wake(len(self.workers))
+        await asyncio.gather(*self.workers, return_exceptions=True)
 
-        # Wait for current tasks to finish
-        await self.queue.join()
+        for process in self.processes.values():
+            await process.stop()
@@ -0,0 +1,132 @@
+"""
+CPU layout: cgroup CPU budget split into encoder threads and worker pinning
+"""
+import os
+import math
+
+# Effective cpuset of the container, cgroup v2 then v1
+CPUSET_FILES = ('/sys/fs/cgroup/cpuset.cpus.effective',
+                '/sys/fs/cgroup/cpuset/cpuset.effective_cpus')
+CPU_MAX_FILE = '/sys/fs/cgroup/cpu.max'
+CFS_FILES = ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us',
+             '/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+
+# Encoder threads of this worker process, set by the pool initializer
+ENCODER_THREADS = 0
+
+def parse_cpu_list(text: str) -> list:
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+def _read(path: str) -> str:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+def cgroup_cpuset() -> list:
+    """CPUs this container may run on"""
+    allowed = os.sched_getaffinity(0)
+    for path in CPUSET_FILES:
+        text = _read(path)
+        if text:
+            # Our own affinity may already be narrower than the cgroup
+            return [cpu for cpu in parse_cpu_list(text) if cpu in allowed] or sorted(allowed)
+    return sorted(allowed)
+
+def cpu_quota():
+    """CFS quota in CPUs, None when unlimited"""
+    text = _read(CPU_MAX_FILE)
+    if text:
+        quota, _, period = text.partition(' ')
+        if quota != 'max':
+            return int(quota) / int(period or 100000)
+        return None
+
+    quota, period = (_read(path) for path in CFS_FILES)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+def init_worker(nice: int, cpus, threads: int):
+    """Worker process initializer: priority, affinity and encoder threads"""
+    global ENCODER_THREADS
+    if nice:
+        os.nice(nice)
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError:
+            # cpuset changed since the layout was planned - run unpinned
+            pass
+    ENCODER_THREADS = threads
+
+    from app.vips_engine import VIPS_SUPPORT
+    if VIPS_SUPPORT and threads:
+        import pyvips
+        pyvips.concurrency_set(threads)
+
+def encoder_threads() -> int:
+    """Encoder threads for this process, 0 leaves the codec default"""
+    return ENCODER_THREADS
+
+def avif_tiling(config) -> dict:
+    """Pillow AVIF tiling options from avif_tiles ('auto' or 'RxC', log2)"""
+    if config.avif_tiles == 'auto':
+        return {'autotiling': True}
+    rows, _, cols = config.avif_tiles.partition('x')
+    return {'autotiling': False, 'tile_rows': int(rows), 'tile_cols': int(cols or rows)}
+
+class CpuLayout:
+    """Splits the container CPU budget between conversion workers.
+
+    Every worker gets budget / workers encoder threads (at least one), so
+    concurrent encodes do not oversubscribe the CPUs. With cpu_pinning each
+    worker is bound to its own slice of the cpuset, wrapping around when
+    there are more workers than CPUs.
+    """
+
+    def __init__(self, config, workers: int):
+        self.config = config
+        self.cpus = cgroup_cpuset()
+        self.quota = cpu_quota()
+        self.budget = len(self.cpus)
+        if self.quota:
+            self.budget = max(1, min(self.budget, math.ceil(self.quota)))
+        self.workers = max(1, workers)
+        self.threads = config.encoder_threads or max(1, self.budget // self.workers)
+        self.assignments = {}
+
+    def assign(self, worker_id, pinned: bool = True):
+        """CPU set (None when unpinned) and encoder threads for a worker"""
+        if worker_id not in self.assignments:
+            cpus = None
+            if self.config.cpu_pinning and pinned:
+                start = sum(1 for c in self.assignments.values() if c is not None) * self.threads
+                cpus = sorted({self.cpus[(start + i) % len(self.cpus)]
+                               for i in range(self.threads)})
+            self.assignments[worker_id] = cpus
+        return self.assignments[worker_id], self.threads
+
+    def load(self) -> float:
+        """1-minute load average per CPU of the budget, not of the host"""
+        return os.getloadavg()[0] / self.budget
+
+    def status(self) -> dict:
+        return {
+            'cpus': self.cpus,
+            'cpu_quota': self.quota,
+            'cpu_budget': self.budget,
+            'workers': self.workers,
+            'encoder_threads': self.threads,
+            'avif_tiles': self.config.avif_tiles,
+            'pinning': self.config.cpu_pinning,
+            'assignments': {str(worker_id): cpus for worker_id, cpus in self.assignments.items()},
+        }
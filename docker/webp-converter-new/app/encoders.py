@@ -0,0 +1,215 @@
+"""
+Pluggable encoder backends: Pillow, pillow-heif and external binaries
+"""
+import io
+import time
+import shutil
+import tempfile
+import subprocess
+from abc import ABC, abstractmethod
+from pathlib import Path
+from PIL import Image, features
+from app.cpu_layout import encoder_threads
+
+# HEIF/AVIF support via pillow-heif
+try:
+    import pillow_heif
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_SUPPORT = True
+except ImportError:
+    HEIF_SUPPORT = False
+
+# Pillow format names and output extensions
+PIL_FORMATS = {'webp': 'WEBP', 'avif': 'AVIF', 'jpeg': 'JPEG'}
+
+class EncoderBackend(ABC):
+    """Encodes a prepared RGB/RGBA image into one output format.
+
+    Options are Pillow-style (quality, method, speed, lossless,
+    alpha_quality, exif, xmp, icc_profile); backends translate what they
+    support and ignore the rest.
+    """
+    name = ''
+    formats = ()
+
+    def available(self, fmt: str, config) -> bool:
+        return True
+
+    @abstractmethod
+    def encode(self, img: Image.Image, fmt: str, options: dict, config) -> bytes:
+        """Encoded output file contents"""
+
+BACKENDS = {}
+
+def register_backend(backend_class):
+    """Class decorator adding backend to the registry"""
+    BACKENDS[backend_class.name] = backend_class()
+    return backend_class
+
+def get_backend(fmt: str, config) -> EncoderBackend:
+    """Backend configured for format in encoder_backends (default pillow)"""
+    name = config.encoder_backends.get(fmt, 'pillow')
+    backend = BACKENDS.get(name)
+    if backend is None or fmt not in backend.formats:
+        raise RuntimeError(f"Encoder backend '{name}' does not support {fmt}")
+    if not backend.available(fmt, config):
+        raise RuntimeError(f"{fmt.upper()} support not available - encoder backend '{name}' missing")
+    return backend
+
+def check_backends(config):
+    """Resolve the backend of every enabled format, so a missing codec or
+    binary fails at startup instead of on every conversion"""
+    for fmt in ('webp', 'avif'):
+        if getattr(config, f'enable_{fmt}'):
+            get_backend(fmt, config)
+
+@register_backend
+class PillowBackend(EncoderBackend):
+    name = 'pillow'
+    formats = ('webp', 'avif', 'jpeg')
+
+    def available(self, fmt, config):
+        return features.check('jpg' if fmt == 'jpeg' else fmt)
+
+    def _options(self, fmt, options):
+        if fmt == 'jpeg':
+            # Optimized progressive baseline for JPEG outputs
+            keep = ('quality', 'exif', 'icc_profile')
+            return {**{k: v for k, v in options.items() if k in keep},
+                    'optimize': True, 'progressive': True}
+        return options
+
+    def encode(self, img, fmt, options, config):
+        buffer = io.BytesIO()
+        img.save(buffer, PIL_FORMATS[fmt], **self._options(fmt, options))
+        return buffer.getvalue()
+
+@register_backend
+class PillowHeifBackend(EncoderBackend):
+    name = 'pillow-heif'
+    formats = ('avif',)
+
+    def available(self, fmt, config):
+        # AVIF encoding was removed from pillow-heif 1.0
+        return HEIF_SUPPORT and hasattr(pillow_heif, 'register_avif_opener')
+
+    def encode(self, img, fmt, options, config):
+        heif = pillow_heif.from_pillow(img)
+        if not options.get('icc_profile'):
+            heif.info.pop('icc_profile', None)
+
+        enc_params = {}
+        if 'speed' in options:
+            enc_params['speed'] = str(options['speed'])
+        if 'max_threads' in options:
+            enc_params['threads'] = str(options['max_threads'])
+
+        buffer = io.BytesIO()
+        heif.save(buffer, format='AVIF',
+                  quality=-1 if options.get('lossless') else options['quality'],
+                  exif=options.get('exif') or None,
+                  xmp=options.get('xmp') or None,
+                  enc_params=enc_params)
+        return buffer.getvalue()
+
+class ExternalBackend(EncoderBackend):
+    """Out-of-process encoder binary"""
+    binary = ''
+
+    def available(self, fmt, config):
+        return shutil.which(config.encoder_binaries.get(self.name, self.binary)) is not None
+
+    def _run(self, args, config, stdin=None) -> bytes:
+        result = subprocess.run(
+            args, input=stdin, capture_output=True,
+            timeout=config.external_encoder_timeout
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"{args[0]} failed: {result.stderr.decode(errors='replace').strip()}")
+        return result.stdout
+
+    @staticmethod
+    def _png(img) -> bytes:
+        """Uncompressed PNG - cheapest lossless container with alpha"""
+        buffer = io.BytesIO()
+        img.save(buffer, 'PNG', compress_level=0)
+        return buffer.getvalue()
+
+@register_backend
+class CwebpBackend(ExternalBackend):
+    name = 'cwebp'
+    binary = 'cwebp'
+    formats = ('webp',)
+
+    def encode(self, img, fmt, options, config):
+        args = [config.encoder_binaries.get(self.name, self.binary), '-quiet',
+                '-q', str(options['quality']), '-m', str(options.get('method', 4))]
+        if options.get('lossless'):
+            args.append('-lossless')
+        if 'alpha_quality' in options:
+            args += ['-alpha_q', str(options['alpha_quality'])]
+        if encoder_threads() > 1:
+            args.append('-mt')
+        # PNG on stdin, WebP on stdout
+        args += ['-o', '-', '--', '-']
+        return self._run(args, config, stdin=self._png(img))
+
+@register_backend
+class AvifencBackend(ExternalBackend):
+    name = 'avifenc'
+    binary = 'avifenc'
+    formats = ('avif',)
+
+    def encode(self, img, fmt, options, config):
+        # avifenc reads stdin only as y4m and cannot write stdout
+        with tempfile.TemporaryDirectory(prefix='avifenc-') as tmp_dir:
+            input_path = Path(tmp_dir) / 'input.png'
+            output_path = Path(tmp_dir) / 'output.avif'
+            input_path.write_bytes(self._png(img))
+
+            args = [config.encoder_binaries.get(self.name, self.binary),
+                    '-s', str(options.get('speed', 6))]
+            args += ['-l'] if options.get('lossless') else ['-q', str(options['quality'])]
+            if 'max_threads' in options:
+                args += ['-j', str(options['max_threads'])]
+            if options.get('autotiling'):
+                args.append('--autotiling')
+            elif 'tile_rows' in options:
+                args += ['--tilerowslog2', str(options['tile_rows']),
+                         '--tilecolslog2', str(options['tile_cols'])]
+            self._run(args + [str(input_path), str(output_path)], config)
+            return output_path.read_bytes()
+
+def benchmark_backends(paths, config, formats=('webp', 'avif')):
+    """Encode every file with every available backend per format.
+
+    Returns {format: {backend: {'files', 'bytes', 'seconds'}}} plus total
+    original bytes. Images are decoded and normalized once per file.
+    """
+    from app.converter import encoder_options, normalize_image
+    from app.content import content_options
+
+    results = {fmt: {} for fmt in formats}
+    original_bytes = 0
+
+    for path in paths:
+        original_bytes += Path(path).stat().st_size
+        with Image.open(path) as img:
+            img, content = normalize_image(img, config)
+            img.load()
+
+        for fmt in formats:
+            options = encoder_options(fmt, config, config.encode_profile)
+            options.update(content_options(fmt, content, config))
+            for name, backend in BACKENDS.items():
+                if fmt not in backend.formats or not backend.available(fmt, config):
+                    continue
+                start = time.perf_counter()
+                size = len(backend.encode(img, fmt, options, config))
+                totals = results[fmt].setdefault(name, {'files': 0, 'bytes': 0, 'seconds': 0.0})
+                totals['files'] += 1
+                totals['bytes'] += size
+                totals['seconds'] += time.perf_counter() - start
+
+    return {'original_bytes': original_bytes, 'formats': results}
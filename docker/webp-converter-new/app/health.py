@@ -3,18 +3,36 @@ HTTP Health check endpoints
 """
 import asyncio
 import os
+import tracemalloc
 from aiohttp import web
+from app.profiler import SamplingProfiler, memory_top
 import structlog
 
 logger = structlog.get_logger()
 
+# Upper bound for one profiling run
+MAX_PROFILE_SECONDS = 300
+
 class HealthCheckServer:
-    def __init__(self, config):
+    def __init__(self, config, lag_monitor=None):
         self.config = config
         self.app = web.Application()
         self.app.router.add_get('/health', self.health_check)
         self.app.router.add_get('/ready', self.readiness_check)
         self.runner = None
+        self.profiler = None
+        self.lag_monitor = lag_monitor
+
+        # Diagnostics cost nothing unless enabled: no routes, no sampler
+        if config.debug_endpoints:
+            self.profiler = SamplingProfiler()
+            self.app.router.add_post('/debug/profile/start', self.profile_start)
+            self.app.router.add_post('/debug/profile/stop', self.profile_stop)
+            self.app.router.add_get('/debug/profile', self.profile)
+            self.app.router.add_post('/debug/memory/start', self.memory_start)
+            self.app.router.add_post('/debug/memory/stop', self.memory_stop)
+            self.app.router.add_get('/debug/memory', self.memory)
+            self.app.router.add_get('/debug/loop', self.loop_lag)
 
     async def health_check(self, request):
         """Liveness probe - service is running"""
@@ -37,6 +55,78 @@ class HealthCheckServer:
             'watch_dir': self.config.watch_dir
         })
 
+    @staticmethod
+    def _number(request, name, default, cast=float):
+        try:
+            return cast(request.query.get(name, default))
+        except ValueError:
+            raise web.HTTPBadRequest(text=f'{name} must be a number')
+
+    async def profile_start(self, request):
+        """Sample all threads for ?seconds=N (default 30) every ?interval_ms=M (default 10)"""
+        seconds = min(self._number(request, 'seconds', 30), MAX_PROFILE_SECONDS)
+        interval = max(self._number(request, 'interval_ms', 10), 1) / 1000
+        if self.profiler.running:
+            return web.json_response({'error': 'Profiler already running'}, status=409)
+
+        self.profiler.start(seconds, interval)
+        logger.info("Sampling profiler started", seconds=seconds, interval=interval)
+        return web.json_response({'status': 'started', 'seconds': seconds,
+                                  'interval': interval}, status=202)
+
+    async def profile_stop(self, request):
+        """Stop profiling now, return collapsed stacks"""
+        await asyncio.to_thread(self.profiler.stop)
+        return self._collapsed()
+
+    async def profile(self, request):
+        """Profile for ?seconds=N, or return the last run without it"""
+        if 'seconds' in request.query:
+            response = await self.profile_start(request)
+            if response.status != 202:
+                return response
+            await asyncio.to_thread(self.profiler.thread.join)
+        elif self.profiler.running:
+            return web.json_response({'error': 'Profiler running, stop it first'}, status=409)
+        return self._collapsed()
+
+    def _collapsed(self):
+        logger.info("Sampling profiler stopped",
+                   samples=self.profiler.samples,
+                   duration=f"{self.profiler.duration:.1f}s")
+        return web.Response(text=self.profiler.collapsed(), content_type='text/plain',
+                            headers={'X-Samples': str(self.profiler.samples)})
+
+    async def memory_start(self, request):
+        """Start tracemalloc with ?frames=N (default 1) per allocation"""
+        frames = self._number(request, 'frames', 1, int)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, frames))
+            logger.info("tracemalloc started", frames=frames)
+        return web.json_response({'status': 'tracing', 'frames': tracemalloc.get_traceback_limit()})
+
+    async def memory_stop(self, request):
+        tracemalloc.stop()
+        logger.info("tracemalloc stopped")
+        return web.json_response({'status': 'stopped'})
+
+    async def memory(self, request):
+        """Top ?limit=N allocation sites grouped by ?key=lineno|filename|traceback"""
+        if not tracemalloc.is_tracing():
+            return web.json_response({'error': 'tracemalloc not started'}, status=409)
+        key = request.query.get('key', 'lineno')
+        if key not in ('lineno', 'filename', 'traceback'):
+            return web.json_response({'error': 'key must be lineno, filename or traceback'},
+                                     status=400)
+        limit = self._number(request, 'limit', 25, int)
+        return web.json_response(await asyncio.to_thread(memory_top, limit, key))
+
+    async def loop_lag(self, request):
+        """Event-loop wakeup lag over the last samples, seconds"""
+        if not self.lag_monitor:
+            return web.json_response({'error': 'Lag monitor not running'}, status=500)
+        return web.json_response(self.lag_monitor.status())
+
     async def start(self):
         """Start HTTP server"""
         logger.info("Starting health check server",
@@ -57,6 +147,8 @@ class HealthCheckServer:
 
     async def stop(self):
         """Stop server"""
+        if self.profiler:
+            self.profiler.stop()
         if self.runner:
             logger.info("Stopping health check server")
             await self.runner.cleanup()
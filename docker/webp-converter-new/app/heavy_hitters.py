@@ -0,0 +1,99 @@
+"""
+Heavy-hitter directories by files, bytes and CPU time (Space-Saving)
+"""
+import os
+from pathlib import Path
+from prometheus_client.core import GaugeMetricFamily
+
+DIMENSIONS = ('files', 'bytes', 'cpu_seconds')
+HELP = {
+    'files': 'Files converted in the busiest directories (Space-Saving estimate)',
+    'bytes': 'Original bytes converted in the busiest directories (Space-Saving estimate)',
+    'cpu_seconds': 'Conversion CPU seconds of the busiest directories (Space-Saving estimate)',
+}
+
+class SpaceSaving:
+    """Weighted Space-Saving top-K over at most capacity keys.
+
+    A new key arriving at a full table replaces the smallest entry and
+    inherits its count as error, so every key with a true count above
+    total / capacity is guaranteed to be in the table and its count is
+    overestimated by at most error.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.counts = {}  # key -> [count, error]
+        self.total = 0
+
+    def add(self, key, weight=1):
+        self.total += weight
+        entry = self.counts.get(key)
+        if entry is not None:
+            entry[0] += weight
+            return
+
+        if len(self.counts) < self.capacity:
+            self.counts[key] = [weight, 0]
+            return
+
+        evicted = min(self.counts, key=lambda k: self.counts[k][0])
+        floor = self.counts.pop(evicted)[0]
+        self.counts[key] = [floor + weight, floor]
+
+    def top(self, limit: int):
+        """[(key, count, error)] by count, largest first"""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, count, error) for key, (count, error) in ranked[:limit]]
+
+class DirectoryTracker:
+    """Attributes conversion work to directories under watch_dir.
+
+    Directories are cut to heavy_hitters_depth levels below watch_dir, so
+    per-image hash directories roll up into the module or site that
+    produced them.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.trackers = {dimension: SpaceSaving(config.heavy_hitters_capacity)
+                         for dimension in DIMENSIONS}
+
+    def directory(self, file_path) -> str:
+        """Directory of file_path relative to watch_dir, cut to the configured depth"""
+        try:
+            relative = Path(file_path).parent.relative_to(self.config.watch_dir)
+        except ValueError:
+            relative = Path(file_path).parent
+        parts = relative.parts[:self.config.heavy_hitters_depth]
+        return os.path.join(*parts) if parts else '.'
+
+    def record(self, file_path, size: int, cpu_seconds: float):
+        directory = self.directory(file_path)
+        self.trackers['files'].add(directory)
+        self.trackers['bytes'].add(directory, size)
+        self.trackers['cpu_seconds'].add(directory, cpu_seconds)
+
+    def top(self, dimension: str, limit: int) -> list:
+        return [{'directory': directory, 'value': count, 'error': error}
+                for directory, count, error in self.trackers[dimension].top(limit)]
+
+    def status(self, limit: int) -> dict:
+        """Top directories per dimension, limit bounded by the table capacity"""
+        limit = min(limit, self.config.heavy_hitters_capacity)
+        return {
+            'depth': self.config.heavy_hitters_depth,
+            'capacity': self.config.heavy_hitters_capacity,
+            'totals': {dimension: tracker.total for dimension, tracker in self.trackers.items()},
+            'top': {dimension: self.top(dimension, limit) for dimension in DIMENSIONS},
+        }
+
+    def collect(self):
+        """Prometheus collector: top_directories ranks per dimension, built per
+        scrape so directories dropping out of the top leave no stale series"""
+        for dimension in DIMENSIONS:
+            family = GaugeMetricFamily(f'webp_top_directory_{dimension}', HELP[dimension],
+                                       labels=['rank', 'directory'])
+            for rank, entry in enumerate(self.top(dimension, self.config.top_directories), 1):
+                family.add_metric([str(rank), entry['directory']], entry['value'])
+            yield family
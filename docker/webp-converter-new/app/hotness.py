@@ -0,0 +1,220 @@
+"""
+Request counting for the deferred AVIF tier
+"""
+import os
+import re
+import time
+import asyncio
+from pathlib import Path
+from urllib.parse import unquote
+from app.metrics import metrics
+import structlog
+
+# Redis counters are optional
+try:
+    import redis.asyncio as aioredis
+    REDIS_SUPPORT = True
+except ImportError:
+    REDIS_SUPPORT = False
+
+logger = structlog.get_logger()
+
+# "GET /upload/resize_cache/... HTTP/1.1" 200
+REQUEST_RE = re.compile(r'"(?:GET|HEAD) (\S+) HTTP/[\d.]+" (\d{3}) ')
+
+class HotnessTracker:
+    """Promotes originals to the AVIF lane once they get enough requests.
+
+    Counts come from the nginx access log (windowed, halved every
+    avif_hot_window seconds) or from Redis counters maintained elsewhere.
+    At most avif_hot_capacity paths are counted: a full table first drops
+    paths requested only once (crawlers, cache busters) and is halved
+    early only if that frees less than a quarter of it.
+    """
+
+    def __init__(self, config, avif_queue, state):
+        self.config = config
+        self.queue = avif_queue
+        self.state = state
+        self.counts = {}
+        # Path -> when it was promoted; not queued again within avif_hot_window
+        self.promoted = {}
+        self.running = True
+
+    def _uri_to_path(self, uri: str):
+        """Map request URI to original file in watch_dir, None if not ours"""
+        uri = unquote(uri.split('?', 1)[0])
+        prefix = self.config.avif_hot_uri_prefix.rstrip('/') + '/'
+        if not uri.startswith(prefix) or '/../' in uri:
+            return None
+
+        if uri.rsplit('.', 1)[-1].lower() not in self.config.extensions:
+            return None
+
+        return os.path.join(self.config.watch_dir, uri[len(prefix):])
+
+    def _needs_avif(self, path: str) -> bool:
+        """Original exists and AVIF is missing or stale, but was not pruned
+        as unprofitable for this version of the original"""
+        try:
+            original = os.stat(path)
+        except OSError:
+            return False
+
+        if original.st_size < self.config.min_file_size:
+            return False
+
+        avif_path = Path(path).with_suffix('.avif')
+        try:
+            return os.stat(avif_path).st_mtime < original.st_mtime
+        except OSError:
+            return not self.state.is_pruned(avif_path, original.st_mtime)
+
+    async def _promote(self, path: str):
+        """Queue hot image for AVIF conversion"""
+        self.counts.pop(path, None)
+        promoted_at = self.promoted.get(path)
+        if promoted_at is not None and time.monotonic() - promoted_at < self.config.avif_hot_window:
+            # Still pending in the AVIF lane (or spilled), or just converted
+            return
+        if not self._needs_avif(path):
+            return
+
+        await self.queue.put(path)
+        self.promoted[path] = time.monotonic()
+        metrics.avif_promoted.inc()
+        logger.debug("Image promoted to AVIF lane", file=path)
+
+    def _count_line(self, line: str):
+        """Count request from access log line, return path when it became hot"""
+        match = REQUEST_RE.search(line)
+        if not match or match.group(2) not in ('200', '304'):
+            return None
+
+        path = self._uri_to_path(match.group(1))
+        if path is None:
+            return None
+
+        count = self.counts.get(path, 0) + 1
+        if count == 1 and len(self.counts) >= self.config.avif_hot_capacity:
+            self._make_room()
+        self.counts[path] = count
+        return path if count >= self.config.avif_hot_threshold else None
+
+    async def _tail_log(self):
+        """Follow nginx access log, reopening it after rotation"""
+        log_path = self.config.avif_hot_log
+        log_file = None
+        inode = None
+        from_start = False
+        partial = ''
+
+        while self.running:
+            if log_file is None:
+                try:
+                    log_file = open(log_path, errors='replace')
+                    inode = os.fstat(log_file.fileno()).st_ino
+                    if not from_start:
+                        log_file.seek(0, os.SEEK_END)
+                except OSError:
+                    await asyncio.sleep(5)
+                    continue
+
+            lines = log_file.readlines(1024 * 1024)
+            if not lines:
+                try:
+                    rotated = os.stat(log_path).st_ino != inode
+                except OSError:
+                    rotated = False
+                if rotated:
+                    log_file.close()
+                    log_file = None
+                    from_start = True
+                    partial = ''
+                    continue
+
+                metrics.avif_hot_tracked.set(len(self.counts))
+                await asyncio.sleep(1)
+                continue
+
+            for line in lines:
+                if not line.endswith('\n'):
+                    partial += line
+                    continue
+                hot = self._count_line(partial + line)
+                partial = ''
+                if hot:
+                    await self._promote(hot)
+
+        if log_file:
+            log_file.close()
+
+    async def _poll_redis(self):
+        """Poll Redis request counters"""
+        client = aioredis.from_url(self.config.avif_hot_redis_url, decode_responses=True)
+        prefix = self.config.avif_hot_redis_prefix
+
+        try:
+            while self.running:
+                try:
+                    async for key in client.scan_iter(match=f'{prefix}*', count=1000):
+                        value = await client.get(key)
+                        try:
+                            if value is None or float(value) < self.config.avif_hot_threshold:
+                                continue
+                            path = self._uri_to_path(key[len(prefix):])
+                        except ValueError:
+                            # One bad counter must not abort the whole poll
+                            logger.debug("Skipping malformed Redis counter", key=key, value=value)
+                            continue
+                        if path:
+                            await self._promote(path)
+                except Exception as e:
+                    logger.warning("Redis counter poll failed", error=str(e))
+
+                self._expire_promoted()
+
+                await asyncio.sleep(self.config.avif_hot_poll_interval)
+        finally:
+            await client.aclose()
+
+    def _halve(self):
+        self.counts = {path: count // 2 for path, count in self.counts.items() if count > 1}
+
+    def _make_room(self):
+        """Shrink a full table before counting a new path"""
+        self.counts = {path: count for path, count in self.counts.items() if count > 1}
+        while len(self.counts) > self.config.avif_hot_capacity * 3 // 4:
+            self._halve()
+
+    def _expire_promoted(self):
+        """Forget promotions older than a window, so failed ones are retried"""
+        cutoff = time.monotonic() - self.config.avif_hot_window
+        self.promoted = {path: at for path, at in self.promoted.items() if at >= cutoff}
+
+    async def _decay(self):
+        """Halve counts every window so old traffic fades out"""
+        while self.running:
+            await asyncio.sleep(self.config.avif_hot_window)
+            self._halve()
+            self._expire_promoted()
+            metrics.avif_hot_tracked.set(len(self.counts))
+
+    async def start(self):
+        """Start counting requests"""
+        source = self.config.avif_hot_source
+        logger.info("Starting AVIF hotness tracker",
+                   source=source,
+                   threshold=self.config.avif_hot_threshold)
+
+        if source == 'redis':
+            if not REDIS_SUPPORT:
+                logger.error("Redis hotness source requires the redis package")
+                return
+            await self._poll_redis()
+        else:
+            await asyncio.gather(self._tail_log(), self._decay())
+
+    async def stop(self):
+        """Stop tracker"""
+        self.running = False
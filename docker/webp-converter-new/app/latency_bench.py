@@ -0,0 +1,151 @@
+"""
+End-to-end latency benchmark: file creation -> watcher -> queue -> outputs
+"""
+import io
+import time
+import shutil
+import asyncio
+import tempfile
+import dataclasses
+from pathlib import Path
+import numpy as np
+from app.benchmark import percentile, photo
+from app.converter import ImageConverter
+from app.cpu_layout import CpuLayout
+from app.queue_manager import QueueManager
+from app.state import StateStore
+from app.watcher import FileWatcher
+
+# Seconds to wait after a phase drains for trailing (duplicate) events
+SETTLE_SECONDS = 1.0
+
+def _template() -> bytes:
+    """VGA photo-like JPEG that converts profitably (not pruned)"""
+    buffer = io.BytesIO()
+    photo(np.random.default_rng(1), (640, 480)).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+class CountingQueue(QueueManager):
+    """QueueManager counting how often every path was enqueued"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.enqueued = {}
+
+    async def put(self, item):
+        self.enqueued[item] = self.enqueued.get(item, 0) + 1
+        await super().put(item)
+
+class LatencyConverter(ImageConverter):
+    """ImageConverter recording when each file was done and how often"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.processed = {}
+        self.finished = {}
+
+    async def _process_file(self, file_path, worker_id):
+        await super()._process_file(file_path, worker_id)
+        self.processed[file_path] = self.processed.get(file_path, 0) + 1
+        self.finished.setdefault(file_path, time.time())
+
+def _distribution(values) -> dict:
+    if not values:
+        return {}
+    return {'count': len(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+            'max': max(values)}
+
+def _create_files(directory: Path, prefix: str, count: int, interval: float, data: bytes) -> dict:
+    """Write count files, interval seconds apart; returns path -> creation time.
+
+    Runs in a thread so the event loop keeps converting meanwhile.
+    """
+    created = {}
+    for i in range(count):
+        path = directory / f'{prefix}-{i}.jpg'
+        created[str(path)] = time.time()
+        path.write_bytes(data)
+        if interval:
+            time.sleep(interval)
+    return created
+
+async def _drain(created: dict, converter, timeout: float) -> float:
+    """Wait until every created file was processed, returns seconds waited"""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if all(path in converter.finished for path in created):
+            break
+        await asyncio.sleep(0.05)
+    return time.monotonic() - start
+
+def _phase_report(name: str, created: dict, queue, converter, formats, drain: float) -> dict:
+    latency = {'done': [converter.finished[path] - created[path]
+                        for path in created if path in converter.finished]}
+    for fmt in formats:
+        latency[fmt] = []
+        for path, created_at in created.items():
+            output_path = Path(path).with_suffix(f'.{fmt}')
+            if output_path.exists():
+                latency[fmt].append(output_path.stat().st_mtime - created_at)
+
+    return {
+        'phase': name,
+        'files': len(created),
+        'processed': sum(1 for path in created if path in converter.finished),
+        'dropped': sum(1 for path in created if path not in converter.finished),
+        # Extra conversions or skip checks caused by repeated events for one file
+        'duplicates': sum(max(0, converter.processed.get(path, 0) - 1) for path in created),
+        'events': sum(queue.enqueued.get(path, 0) for path in created),
+        'drain_seconds': drain,
+        'latency': {name: _distribution(values) for name, values in latency.items()},
+    }
+
+async def run_latency_benchmark(config, rate: float = 1.0, duration: float = 10.0,
+                                bursts=(100, 1000), workers: int = 2,
+                                timeout: float = 300.0) -> list:
+    """Run a steady-rate phase, then each burst, against a temporary watch dir.
+
+    Returns one report per phase with create-to-output latency
+    distributions (seconds) per format, dropped and duplicated events.
+    """
+    watch_dir = Path(tempfile.mkdtemp(prefix='webp-latency-'))
+    config = dataclasses.replace(config, watch_dir=str(watch_dir))
+    formats = ('webp',) if config.avif_tier == 'hot' else ('webp', 'avif')
+    formats = tuple(fmt for fmt in formats if getattr(config, f'enable_{fmt}'))
+
+    queue = CountingQueue(config)
+    state = StateStore(':memory:')
+    converter = LatencyConverter(config, queue, state, formats=formats, worker_count=workers,
+                                 layout=CpuLayout(config, workers))
+    watcher = FileWatcher(config, queue)
+    tasks = [asyncio.create_task(watcher.start()), asyncio.create_task(converter.start())]
+
+    data = _template()
+    phases = []
+    if rate and duration:
+        phases.append((f'rate {rate:g}/s x {duration:g}s', int(rate * duration), 1 / rate))
+    phases += [(f'burst {count}', count, 0) for count in bursts]
+
+    reports = []
+    try:
+        # Give the observer time to register its inotify watches
+        await asyncio.sleep(0.5)
+        for index, (name, count, interval) in enumerate(phases):
+            created = await asyncio.to_thread(
+                _create_files, watch_dir, f'p{index}', count, interval, data)
+            drain = await _drain(created, converter, timeout)
+            await asyncio.sleep(SETTLE_SECONDS)
+            reports.append(_phase_report(name, created, queue, converter, formats, drain))
+    finally:
+        await watcher.stop()
+        # Workers leave the loop once stopped, so trailing events must drain first
+        await asyncio.wait_for(queue.join(), timeout)
+        await converter.stop()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        state.close()
+        shutil.rmtree(watch_dir, ignore_errors=True)
+
+    return reports
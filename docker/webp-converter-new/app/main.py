@@ -8,19 +8,59 @@ from app.config import Config
 from app.logger import setup_logger
 from app.watcher import FileWatcher
 from app.converter import ImageConverter
+from app.hotness import HotnessTracker
 from app.queue_manager import QueueManager
-from app.metrics import MetricsServer
+from app.reoptimizer import Reoptimizer
+from app.campaign import ReencodeCampaign
+from app.state import StateStore
+from app.cpu_layout import CpuLayout
+from app.encoders import check_backends
+from app.heavy_hitters import DirectoryTracker
+from app.metrics import MetricsServer, release_dead_processes
 from app.health import HealthCheckServer
+from app.profiler import LoopLagMonitor
 
 class WebPConverterApp:
     def __init__(self):
         self.config = Config()
         self.logger = setup_logger(self.config.log_level)
-        self.queue_manager = QueueManager(self.config)
-        self.converter = ImageConverter(self.config, self.queue_manager)
+        self.queue_manager = QueueManager(self.config, spill_dir=self.config.queue_spill_dir)
+        self.state = StateStore(self.config.state_db)
+        hot_tier = self.config.avif_tier == 'hot'
+        self.layout = CpuLayout(self.config, self.config.worker_threads
+                                + (self.config.avif_workers if hot_tier else 0))
+        self.directories = DirectoryTracker(self.config)
+        if hot_tier:
+            # WebP right away, AVIF in a separate low-priority lane for hot images
+            self.avif_queue = QueueManager(self.config, lane='avif',
+                                           maxsize=self.config.avif_queue_size,
+                                           spill_dir=self.config.queue_spill_dir)
+            self.converter = ImageConverter(self.config, self.queue_manager, self.state,
+                                            formats=('webp',), layout=self.layout,
+                                            directories=self.directories)
+            self.avif_converter = ImageConverter(self.config, self.avif_queue, self.state,
+                                                 lane='avif', formats=('avif',),
+                                                 worker_count=self.config.avif_workers,
+                                                 nice=self.config.avif_nice,
+                                                 layout=self.layout,
+                                                 directories=self.directories)
+            self.hotness = HotnessTracker(self.config, self.avif_queue, self.state)
+        else:
+            self.avif_queue = None
+            self.converter = ImageConverter(self.config, self.queue_manager, self.state,
+                                            layout=self.layout, directories=self.directories)
+            self.avif_converter = None
+            self.hotness = None
+        self.reoptimizer = Reoptimizer(self.config, self.converter,
+                                       self.queue_manager, self.state, self.avif_queue)
+        self.campaign = ReencodeCampaign(self.config, self.converter,
+                                         self.queue_manager, self.state, self.avif_queue)
         self.watcher = FileWatcher(self.config, self.queue_manager)
-        self.metrics_server = MetricsServer(self.config, self.queue_manager)
-        self.health_server = HealthCheckServer(self.config)
+        self.metrics_server = MetricsServer(self.config, self.queue_manager,
+                                            self.avif_queue, self.layout, self.campaign,
+                                            self.directories)
+        self.lag_monitor = LoopLagMonitor()
+        self.health_server = HealthCheckServer(self.config, self.lag_monitor)
         self.running = True
         self.tasks = []
 
@@ -29,6 +69,20 @@ class WebPConverterApp:
         self.logger.info("Starting WebP Converter service",
                         watch_dir=self.config.watch_dir,
                         quality=self.config.webp_quality)
+        self.logger.info("CPU layout",
+                        cpu_budget=self.layout.budget,
+                        workers=self.layout.workers,
+                        encoder_threads=self.layout.threads,
+                        pinning=self.config.cpu_pinning)
+
+        try:
+            check_backends(self.config)
+        except RuntimeError as e:
+            self.logger.error("Encoder backend unavailable", error=str(e))
+            sys.exit(1)
+
+        # Metric files of an earlier run's processes (multiprocess mode)
+        release_dead_processes()
 
         # Register signal handlers for graceful shutdown
         loop = asyncio.get_event_loop()
@@ -42,9 +96,17 @@ class WebPConverterApp:
         self.tasks = [
             asyncio.create_task(self.watcher.start()),
             asyncio.create_task(self.converter.start()),
+            asyncio.create_task(self.reoptimizer.start()),
+            asyncio.create_task(self.campaign.start()),
             asyncio.create_task(self.metrics_server.start()),
             asyncio.create_task(self.health_server.start()),
+            asyncio.create_task(self.lag_monitor.start()),
         ]
+        if self.avif_converter:
+            self.tasks += [
+                asyncio.create_task(self.avif_converter.start()),
+                asyncio.create_task(self.hotness.start()),
+            ]
 
         # Initial scan of existing files
         if self.config.initial_scan:
@@ -66,10 +128,20 @@ class WebPConverterApp:
         self.running = False
 
         # Stop components
+        await self.reoptimizer.stop()
+        await self.campaign.stop()
         await self.converter.stop()
+        if self.avif_converter:
+            await self.hotness.stop()
+            await self.avif_converter.stop()
         await self.watcher.stop()
         await self.metrics_server.stop()
         await self.health_server.stop()
+        self.lag_monitor.stop()
+        self.queue_manager.close()
+        if self.avif_queue:
+            self.avif_queue.close()
+        self.state.close()
 
         # Cancel all tasks
         for task in self.tasks:
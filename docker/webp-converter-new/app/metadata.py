@@ -0,0 +1,73 @@
+"""
+Metadata stripping and ICC normalization
+"""
+import io
+from PIL import Image, ImageCms, ImageOps
+
+ORIENTATION_TAG = 0x0112
+# Orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+# Info keys carrying XMP (JPEG/WebP, PNG)
+XMP_KEYS = ('xmp', 'XML:com.adobe.xmp')
+
+SRGB_PROFILE = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB'))
+
+def oriented_size(img: Image.Image):
+    """Image size after EXIF orientation is applied"""
+    if img.getexif().get(ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+        return img.height, img.width
+    return img.size
+
+def _to_srgb(img: Image.Image, icc: bytes) -> Image.Image:
+    """Convert pixels from embedded profile to sRGB"""
+    source = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+    if 'srgb' in ImageCms.getProfileDescription(source).lower():
+        return img
+
+    output_mode = 'RGBA' if img.mode == 'RGBA' else 'RGB'
+    return ImageCms.profileToProfile(img, source, SRGB_PROFILE, outputMode=output_mode)
+
+def apply_metadata_policy(img: Image.Image, config):
+    """Apply EXIF orientation, then strip EXIF/XMP and keep, convert or drop ICC.
+
+    Returns image, explicit encoder metadata options and bytes removed per
+    kind (exif, xmp, icc).
+    """
+    orientation = img.getexif().get(ORIENTATION_TAG, 1)
+    if orientation != 1:
+        # Pixels are rotated, so the tag must not survive
+        img = ImageOps.exif_transpose(img)
+
+    exif = img.info.get('exif', b'')
+    xmp = next((img.info[key] for key in XMP_KEYS if img.info.get(key)), b'')
+    if isinstance(xmp, str):
+        xmp = xmp.encode()
+    icc = img.info.get('icc_profile') or b''
+
+    removed = {}
+    options = {}
+    if config.strip_metadata:
+        removed['exif'] = len(exif)
+        removed['xmp'] = len(xmp)
+        options.update(exif=b'', xmp=b'')
+    else:
+        options.update(exif=exif, xmp=xmp)
+
+    policy = config.icc_policy
+    if icc and policy == 'srgb':
+        try:
+            if img.mode not in ('RGB', 'RGBA', 'CMYK'):
+                raise OSError(f'cannot transform {img.mode} image')
+            img = _to_srgb(img, icc)
+        except (ImageCms.PyCMSError, OSError):
+            # Broken profile or palette image - keep it rather than shift colors
+            policy = 'keep'
+
+    if icc and policy == 'keep':
+        options['icc_profile'] = icc
+    else:
+        # sRGB is what browsers assume for untagged images
+        removed['icc'] = len(icc)
+        options['icc_profile'] = b''
+
+    return img, options, {'orientation_applied': orientation != 1, 'removed': removed}
@@ -1,14 +1,27 @@
 """
 Prometheus metrics for monitoring
 """
+import os
+import glob
 import asyncio
 import json
 from aiohttp import web
-from prometheus_client import Counter, Histogram, Gauge, Summary, generate_latest
+from prometheus_client import (Counter, Histogram, Gauge, CollectorRegistry, REGISTRY,
+                               generate_latest, multiprocess)
+from prometheus_client.mmap_dict import MmapedDict
 import structlog
 
 logger = structlog.get_logger()
 
+# Set before the service starts: values then live in mmap files shared by
+# all processes and /metrics aggregates them
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+# Gauges are set by the main process - report its value, drop dead processes
+GAUGE_MODE = 'livemostrecent'
+
+# 10 KB to 25 MB
+SIZE_BUCKETS = tuple(1024 * kb for kb in (10, 25, 50, 100, 250, 500, 1024, 2560, 5120, 10240, 25600))
+
 class Metrics:
     def __init__(self):
         # Counters
@@ -34,36 +47,122 @@ class Metrics:
             buckets=(0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
         )
 
-        # Summary for file sizes
-        self.original_size = Summary(
+        # Per-stage tracing of every file
+        self.stage_duration = Histogram(
+            'webp_stage_duration_seconds',
+            'Time per conversion stage (queue_wait, validate, read, decode, '
+            'normalize, resize, encode_<format>, write, finalize)',
+            ['stage'],
+            buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+        )
+
+        self.slow_files = Counter(
+            'webp_slow_files_total',
+            'Total number of files processed slower than slow_file_seconds'
+        )
+
+        # Event loop and watcher hand-off
+        self.event_loop_lag = Histogram(
+            'webp_event_loop_lag_seconds',
+            'How late the event loop woke up a sleeping task',
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+        )
+
+        self.watcher_buffered = Gauge(
+            'webp_watcher_buffered',
+            'Paths waiting in the watcher hand-off buffer',
+            multiprocess_mode=GAUGE_MODE
+        )
+
+        # Freshness SLO
+        self.freshness = Histogram(
+            'webp_freshness_seconds',
+            'Time from original mtime until the converted output is in place '
+            '(format webp_variants/avif_variants: the width ladder)',
+            ['format', 'lane'],
+            buckets=(1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 21600, 86400)
+        )
+
+        self.backlog_oldest_age = Gauge(
+            'webp_backlog_oldest_age_seconds',
+            'Age (since mtime) of the oldest queued, not yet converted original',
+            ['lane'],
+            multiprocess_mode=GAUGE_MODE
+        )
+
+        # File sizes, aggregatable across instances
+        self.original_size = Histogram(
             'webp_original_size_bytes',
-            'Size of original images in bytes'
+            'Size of original images in bytes',
+            ['format', 'extension'],
+            buckets=SIZE_BUCKETS
         )
 
-        self.webp_size = Summary(
+        self.webp_size = Histogram(
             'webp_webp_size_bytes',
-            'Size of WebP images in bytes'
+            'Size of WebP images in bytes',
+            ['extension'],
+            buckets=SIZE_BUCKETS
         )
 
-        self.avif_size = Summary(
+        self.avif_size = Histogram(
             'webp_avif_size_bytes',
-            'Size of AVIF images in bytes'
+            'Size of AVIF images in bytes',
+            ['extension'],
+            buckets=SIZE_BUCKETS
+        )
+
+        self.input_bytes = Counter(
+            'webp_input_bytes_total',
+            'Bytes of originals converted',
+            ['format', 'extension']
+        )
+
+        self.output_bytes = Counter(
+            'webp_output_bytes_total',
+            'Bytes of converted outputs kept',
+            ['format', 'extension']
+        )
+
+        self.saved_bytes = Counter(
+            'webp_saved_bytes_total',
+            'Bytes saved by converted outputs over their originals',
+            ['format', 'extension']
         )
 
         # Gauge for current values
         self.queue_size = Gauge(
             'webp_queue_size',
-            'Current size of the conversion queue'
+            'Current size of the conversion queue',
+            ['lane'],
+            multiprocess_mode=GAUGE_MODE
+        )
+
+        self.queue_spill_size = Gauge(
+            'webp_queue_spill_size',
+            'Paths waiting in the on-disk overflow tier',
+            ['lane'],
+            multiprocess_mode=GAUGE_MODE
+        )
+
+        self.queue_spilled_total = Counter(
+            'webp_queue_spilled_total',
+            'Total number of paths spilled to disk because the queue was full',
+            ['lane']
         )
 
         self.compression_ratio = Gauge(
             'webp_compression_ratio',
-            'Current compression ratio (percentage saved)'
+            'Compression ratio of the last WebP conversion (percentage saved), '
+            'prefer webp_saved_bytes_total / webp_input_bytes_total',
+            multiprocess_mode=GAUGE_MODE
         )
 
         self.avif_compression_ratio = Gauge(
             'webp_avif_compression_ratio',
-            'Current AVIF compression ratio (percentage saved)'
+            'Compression ratio of the last AVIF conversion (percentage saved), '
+            'prefer webp_saved_bytes_total / webp_input_bytes_total',
+            multiprocess_mode=GAUGE_MODE
         )
 
         # AVIF metrics
@@ -83,20 +182,275 @@ class Metrics:
             buckets=(0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
         )
 
+        # Worker process metrics
+        self.worker_rss = Gauge(
+            'webp_worker_rss_bytes',
+            'Resident memory of conversion worker process',
+            ['worker'],
+            multiprocess_mode=GAUGE_MODE
+        )
+
+        self.worker_recycles = Counter(
+            'webp_worker_recycles_total',
+            'Total number of worker process recycles',
+            ['reason']
+        )
+
+        # Background re-optimization
+        self.reoptimized = Counter(
+            'webp_reoptimized_total',
+            'Total number of outputs re-encoded with the re-optimization profile',
+            ['format']
+        )
+
+        self.reoptimize_saved_bytes = Counter(
+            'webp_reoptimize_saved_bytes_total',
+            'Bytes saved by background re-optimization',
+            ['format']
+        )
+
+        # Re-encode campaigns
+        self.campaign_reencoded = Counter(
+            'webp_campaign_reencoded_total',
+            'Total number of outputs re-encoded by the settings campaign',
+            ['format']
+        )
+
+        self.campaign_total = Gauge(
+            'webp_campaign_total',
+            'Outdated or missing outputs when the campaign started',
+            multiprocess_mode=GAUGE_MODE
+        )
+
+        self.campaign_done = Gauge(
+            'webp_campaign_done',
+            'Outputs handled by the current campaign',
+            multiprocess_mode=GAUGE_MODE
+        )
+
+        self.campaign_eta = Gauge(
+            'webp_campaign_eta_seconds',
+            'Estimated wall-clock seconds until the campaign finishes',
+            multiprocess_mode=GAUGE_MODE
+        )
+
+        # Deferred AVIF tier
+        self.avif_promoted = Counter(
+            'webp_avif_promoted_total',
+            'Total number of hot images promoted to the AVIF lane'
+        )
+
+        self.avif_hot_tracked = Gauge(
+            'webp_avif_hot_tracked',
+            'Number of images with request counts below the AVIF threshold',
+            multiprocess_mode=GAUGE_MODE
+        )
+
+        # Variant pruning
+        self.variants_pruned = Counter(
+            'webp_variants_pruned_total',
+            'Total number of variants discarded for insufficient savings',
+            ['format']
+        )
+
+        self.pruned_bytes = Counter(
+            'webp_pruned_bytes_total',
+            'Total size of discarded variants in bytes',
+            ['format']
+        )
+
+        # Target-quality (SSIM) search
+        self.ssim_images = Counter(
+            'webp_ssim_images_total',
+            'Total number of images encoded with target-quality search',
+            ['format']
+        )
+
+        self.ssim_trials = Counter(
+            'webp_ssim_trials_total',
+            'Total number of trial encodes in target-quality search',
+            ['format']
+        )
+
+        self.ssim_quality = Histogram(
+            'webp_ssim_quality',
+            'Encoder quality chosen by target-quality search',
+            ['format'],
+            buckets=(30, 40, 50, 60, 70, 75, 80, 85, 90, 95, 100)
+        )
+
+        self.ssim_baseline_bytes = Counter(
+            'webp_ssim_baseline_bytes_total',
+            'Size the fixed-quality encode would have had',
+            ['format']
+        )
+
+        self.ssim_output_bytes = Counter(
+            'webp_ssim_output_bytes_total',
+            'Size of outputs written by target-quality search',
+            ['format']
+        )
+
+        self.ssim_extra_cpu = Counter(
+            'webp_ssim_extra_cpu_seconds_total',
+            'CPU time spent on search beyond the fixed-quality encode',
+            ['format']
+        )
+
+        # Content-aware encoding
+        self.class_images = Counter(
+            'webp_content_class_images_total',
+            'Total number of images encoded per content class',
+            ['format', 'content_class']
+        )
+
+        self.class_original_bytes = Counter(
+            'webp_content_class_original_bytes_total',
+            'Size of originals per content class',
+            ['format', 'content_class']
+        )
+
+        self.class_output_bytes = Counter(
+            'webp_content_class_output_bytes_total',
+            'Size of outputs per content class',
+            ['format', 'content_class']
+        )
+
+        self.alpha_dropped = Counter(
+            'webp_alpha_dropped_total',
+            'Total number of fully opaque alpha planes dropped',
+            ['format']
+        )
+
+        self.downscaled = Counter(
+            'webp_downscaled_total',
+            'Total number of oversized originals downscaled during conversion',
+            ['format']
+        )
+
+        # Metadata policy
+        self.metadata_removed_bytes = Counter(
+            'webp_metadata_removed_bytes_total',
+            'Metadata bytes not carried into outputs',
+            ['format', 'kind']
+        )
+
+        self.orientation_applied = Counter(
+            'webp_orientation_applied_total',
+            'Total number of images rotated by EXIF orientation',
+            ['format']
+        )
+
+        # Animated images
+        self.animated_frames = Counter(
+            'webp_animated_frames_total',
+            'Total number of animation frames encoded',
+            ['format']
+        )
+
+        self.animated_skipped = Counter(
+            'webp_animated_skipped_total',
+            'Total number of animations left unconverted',
+            ['reason']
+        )
+
+        # Responsive width variants
+        self.variants_generated = Counter(
+            'webp_variants_generated_total',
+            'Total number of responsive width variants generated',
+            ['format']
+        )
+
+        self.variant_duration = Histogram(
+            'webp_variant_duration_seconds',
+            'Time spent generating the width ladder of one image',
+            buckets=(0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+        )
+
+        self.variant_stage_duration = Histogram(
+            'webp_variant_stage_duration_seconds',
+            'Width ladder time per stage (decode, resize, encode_<format>)',
+            ['stage'],
+            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+        )
+
 # Global metrics instance
 metrics = Metrics()
 
+def _file_pid(path: str):
+    """Process id in a multiprocess file name ({type}[_{mode}]_{pid}.db), None for archives"""
+    pid = os.path.basename(path)[:-3].rsplit('_', 1)[-1]
+    return int(pid) if pid.isdigit() else None
+
+def release_process(pid: int):
+    """Fold a finished process's files into the archive and remove them.
+
+    Counters and histograms must keep counting after the process is
+    gone, so their values are added to {type}_archive.db. Gauges of dead
+    processes are dropped. Runs on the event loop between scrapes, so a
+    scrape never sees the values twice or not at all.
+    """
+    if not MULTIPROC_DIR or not pid:
+        return
+
+    multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, f'*_{pid}.db')):
+        kind = os.path.basename(path).split('_', 1)[0]
+        if kind != 'gauge':
+            archive = MmapedDict(os.path.join(MULTIPROC_DIR, f'{kind}_archive.db'))
+            try:
+                for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(path):
+                    archive.write_value(key, archive.read_value(key)[0] + value, timestamp)
+            finally:
+                archive.close()
+        os.remove(path)
+
+def release_dead_processes():
+    """Release files left by processes of an earlier run (non-tmpfs directory)"""
+    if not MULTIPROC_DIR:
+        return
+    pids = {_file_pid(path) for path in glob.glob(os.path.join(MULTIPROC_DIR, '*.db'))}
+    for pid in pids - {None, os.getpid()}:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            release_process(pid)
+        except PermissionError:
+            # Alive, owned by someone else
+            pass
+
 class MetricsServer:
-    def __init__(self, config, queue_manager=None):
+    def __init__(self, config, queue_manager=None, avif_queue=None, layout=None, campaign=None,
+                 directories=None):
         self.config = config
         self.queue_manager = queue_manager
+        self.avif_queue = avif_queue
+        self.layout = layout
+        self.campaign = campaign
+        self.directories = directories
+        # Collectors computed at scrape time rather than stored in metric values
+        self.collectors = [directories] if directories else []
+        if not MULTIPROC_DIR:
+            for collector in self.collectors:
+                REGISTRY.register(collector)
         self.app = None
         self.runner = None
         self.site = None
 
     async def metrics_handler(self, request):
         """Serve Prometheus metrics"""
-        metrics_output = generate_latest()
+        for queue in (self.queue_manager, self.avif_queue):
+            if queue:
+                metrics.backlog_oldest_age.labels(lane=queue.lane).set(queue.oldest_pending_age())
+        if MULTIPROC_DIR:
+            # Fresh registry per scrape: merges the files of every process
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry, MULTIPROC_DIR)
+            for collector in self.collectors:
+                registry.register(collector)
+        else:
+            registry = REGISTRY
+        metrics_output = generate_latest(registry)
         # generate_latest() возвращает bytes
         return web.Response(
             body=metrics_output,
@@ -107,9 +461,25 @@ class MetricsServer:
         """Serve queue status as JSON"""
         if self.queue_manager:
             status = self.queue_manager.get_status()
+            if self.avif_queue:
+                status['avif_lane'] = self.avif_queue.get_status()
+            if self.layout:
+                status['cpu_layout'] = self.layout.status()
+            if self.campaign:
+                status['campaign'] = self.campaign.status()
             return web.json_response(status)
         return web.json_response({'error': 'Queue manager not available'}, status=500)
 
+    async def top_directories_handler(self, request):
+        """Serve heavy-hitter directories as JSON, ?limit=N per dimension"""
+        if not self.directories:
+            return web.json_response({'error': 'Directory tracking not available'}, status=500)
+        try:
+            limit = int(request.query.get('limit', self.config.top_directories))
+        except ValueError:
+            return web.json_response({'error': 'limit must be an integer'}, status=400)
+        return web.json_response(self.directories.status(max(1, limit)))
+
     async def start(self):
         """Start HTTP server for metrics"""
         logger.info("Starting metrics server",
@@ -119,6 +489,7 @@ class MetricsServer:
         self.app = web.Application()
         self.app.router.add_get('/metrics', self.metrics_handler)
         self.app.router.add_get('/queue/status', self.queue_status_handler)
+        self.app.router.add_get('/directories/top', self.top_directories_handler)
 
         # Start server
         self.runner = web.AppRunner(self.app)
@@ -128,7 +499,7 @@ class MetricsServer:
 
         logger.info("Metrics server started",
                    port=self.config.metrics_port,
-                   endpoints=['/metrics', '/queue/status'])
+                   endpoints=['/metrics', '/queue/status', '/directories/top'])
 
         # Keep running
         while True:
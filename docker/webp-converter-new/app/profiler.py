@@ -0,0 +1,130 @@
+"""
+On-demand diagnostics: sampling profiler, tracemalloc snapshots, event-loop lag
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+import tracemalloc
+from collections import Counter, deque
+from app.metrics import metrics
+
+class SamplingProfiler:
+    """Samples the stacks of every thread of this process from a thread.
+
+    Results are collapsed stacks ("thread;outer;...;inner count" per
+    line), the input format of flamegraph.pl and speedscope. Worker
+    processes are not sampled - their time shows up as the awaiting
+    frames of the main process.
+    """
+
+    def __init__(self):
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds: float, interval: float):
+        """Start sampling for at most seconds, every interval seconds"""
+        if self.running:
+            raise RuntimeError('Profiler already running')
+        self.stop_event.clear()
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self._sample, args=(seconds, interval),
+                                       name='sampling-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sampler thread"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _sample(self, seconds: float, interval: float):
+        me = threading.get_ident()
+        names = {}
+        deadline = self.started_at + seconds
+        while not self.stop_event.wait(interval) and time.monotonic() < deadline:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}'
+                                 f':{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+        self.duration = time.monotonic() - self.started_at
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+def memory_top(limit: int, key_type: str = 'lineno') -> dict:
+    """Largest allocation sites of the current tracemalloc snapshot"""
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ))
+    stats = snapshot.statistics(key_type)
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'traced_bytes': current,
+        'peak_bytes': peak,
+        'top': [{'site': (stat.traceback.format() if key_type == 'traceback'
+                          else str(stat.traceback)),
+                 'size': stat.size, 'count': stat.count}
+                for stat in stats[:limit]],
+    }
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a sleeping task.
+
+    Lag is time the loop spent on other callbacks (or blocked in sync
+    code) past the requested wakeup. Every sample goes to
+    webp_event_loop_lag_seconds; the recent ones back /debug/loop.
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 600):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.running = True
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.samples.append(lag)
+            metrics.event_loop_lag.observe(lag)
+
+    def stop(self):
+        self.running = False
+
+    def status(self) -> dict:
+        if not self.samples:
+            return {'samples': 0}
+        ordered = sorted(self.samples)
+        return {
+            'samples': len(ordered),
+            'interval': self.interval,
+            'last': self.samples[-1],
+            'p50': ordered[len(ordered) // 2],
+            'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            'max': ordered[-1],
+        }
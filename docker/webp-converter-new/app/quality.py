@@ -0,0 +1,97 @@
+"""
+Target-quality search: lowest encoder quality that reaches an SSIM target
+"""
+import io
+import time
+from PIL import Image
+
+# NumPy is needed for SSIM only
+try:
+    import numpy as np
+    SSIM_SUPPORT = True
+except ImportError:
+    SSIM_SUPPORT = False
+
+# SSIM stabilizing constants for 8-bit data
+C1 = (0.01 * 255) ** 2
+C2 = (0.03 * 255) ** 2
+
+def luma_plane(img: Image.Image, max_side: int):
+    """Downscaled luma plane as float64 array"""
+    luma = img.convert('L')
+    scale = max(luma.size) / max_side
+    if scale > 1:
+        luma = luma.resize((max(1, round(luma.width / scale)),
+                            max(1, round(luma.height / scale))),
+                           Image.Resampling.BOX)
+    return np.asarray(luma, dtype=np.float64)
+
+def _box_mean(a, k: int):
+    """Mean over every k x k window via integral image"""
+    c = np.pad(a, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    return (c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]) / (k * k)
+
+def ssim(x, y, window: int = 7) -> float:
+    """Mean structural similarity of two equally sized luma planes"""
+    window = min(window, *x.shape)
+    mx = _box_mean(x, window)
+    my = _box_mean(y, window)
+    sxx = _box_mean(x * x, window) - mx * mx
+    syy = _box_mean(y * y, window) - my * my
+    sxy = _box_mean(x * y, window) - mx * my
+
+    num = (2 * mx * my + C1) * (2 * sxy + C2)
+    den = (mx * mx + my * my + C1) * (sxx + syy + C2)
+    return float((num / den).mean())
+
+def search_quality(img: Image.Image, options: dict, config, encode):
+    """Binary-search quality for config.ssim_target, bounded by ssim_max_trials.
+
+    The first trial uses the configured fixed quality, so its size is the
+    baseline for savings and its CPU time is not counted as extra.
+    encode(options) returns the encoded bytes for one trial.
+    Returns encoded bytes and search stats.
+    """
+    reference = luma_plane(img, config.ssim_max_side)
+    lo, hi = config.ssim_min_quality, config.ssim_max_quality
+    quality = min(max(options['quality'], lo), hi)
+
+    best = None
+    highest = None
+    baseline_size = 0
+    baseline_cpu = 0.0
+    trials = 0
+    cpu_start = time.process_time()
+
+    while lo <= hi and trials < config.ssim_max_trials:
+        data = encode({**options, 'quality': quality})
+        trials += 1
+
+        with Image.open(io.BytesIO(data)) as decoded:
+            score = ssim(reference, luma_plane(decoded, config.ssim_max_side))
+
+        if trials == 1:
+            baseline_size = len(data)
+            baseline_cpu = time.process_time() - cpu_start
+
+        if highest is None or quality > highest[0]:
+            highest = (quality, data, score)
+
+        if score >= config.ssim_target:
+            best = (quality, data, score)
+            hi = quality - 1
+        else:
+            lo = quality + 1
+        quality = (lo + hi) // 2
+
+    # Target unreachable within budget - keep the best looking attempt
+    quality, data, score = best or highest
+
+    return data, {
+        'quality': quality,
+        'ssim': score,
+        'trials': trials,
+        'baseline_size': baseline_size,
+        'size': len(data),
+        'extra_cpu': time.process_time() - cpu_start - baseline_cpu,
+    }
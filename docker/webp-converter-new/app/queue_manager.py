@@ -1,18 +1,32 @@
 """
 Queue management with rate limiting
 """
+import os
+import time
 import asyncio
 from collections import deque
 from datetime import datetime
+from pathlib import Path
 from app.metrics import metrics
+from app.spill import SpillQueue
 import structlog
 
 logger = structlog.get_logger()
 
+# Seconds spilled appends may stay buffered in the process
+SPILL_FLUSH_DELAY = 0.5
+
 class QueueManager:
-    def __init__(self, config):
+    def __init__(self, config, lane='main', maxsize=None, spill_dir=None):
         self.config = config
-        self.queue = asyncio.Queue(maxsize=config.max_queue_size)
+        self.lane = lane
+        self.queue = asyncio.Queue(maxsize=maxsize or config.max_queue_size)
+        # Overflow tier: with spill_dir, puts to a full queue go to disk
+        # instead of waiting, and get() refills the queue from there
+        self.spill = (SpillQueue(Path(spill_dir) / lane, config.watch_dir,
+                                 config.queue_spill_segment)
+                      if spill_dir else None)
+        self._flush_handle = None
         # Rate limiter: max files per minute
         self.rate_limiter = asyncio.Semaphore(config.rate_limit)
         self._reset_limiter_task = None
@@ -23,6 +37,10 @@ class QueueManager:
 
         # Current processing items
         self.currently_processing = {}
+        # First enqueue time and original mtime per pending path,
+        # for queue wait tracing and backlog age
+        self.enqueued_at = {}
+        self.pending_mtime = {}
 
         # Statistics
         self.stats = {
@@ -34,18 +52,91 @@ class QueueManager:
 
     async def put(self, item: str):
         """Add item to queue with rate limiting"""
+        if item is not None and self.spill is not None and (len(self.spill) or self.queue.full()):
+            # Behind spilled items or no room - keep order and do not wait
+            if item in self.enqueued_at or await self._spill(item):
+                # A path still queued in memory gets converted in its current version anyway
+                return
+
+        if item is not None:
+            # Counted from the first event - a blocked put is waiting too
+            self.enqueued_at.setdefault(item, time.monotonic())
+            if item not in self.pending_mtime:
+                mtime = await self._mtime(item)
+                if mtime is not None:
+                    self.pending_mtime.setdefault(item, mtime)
         async with self.rate_limiter:
             await self.queue.put(item)
-            metrics.queue_size.set(self.queue.qsize())
+            metrics.queue_size.labels(lane=self.lane).set(self.queue.qsize())
             logger.debug("Item added to queue",
                         queue_size=self.queue.qsize())
 
     async def get(self):
         """Get item from queue"""
+        if self.spill is not None:
+            self._refill()
         item = await self.queue.get()
-        metrics.queue_size.set(self.queue.qsize())
+        metrics.queue_size.labels(lane=self.lane).set(self.queue.qsize())
         return item
 
+    async def _mtime(self, item: str):
+        """Original mtime, None if gone. Stat runs in a thread, the watched
+        tree may be on slow network storage"""
+        try:
+            return (await asyncio.to_thread(os.stat, item)).st_mtime
+        except OSError:
+            return None
+
+    async def _spill(self, item: str) -> bool:
+        """Append item to the overflow tier, False if it must go through memory"""
+        mtime = await self._mtime(item)
+        if mtime is None:
+            # Gone before it was queued - nothing to convert
+            return True
+        if not self.spill.append(item, time.time(), mtime):
+            return False
+        if self._flush_handle is None:
+            # One write per burst of spills instead of one per path
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                SPILL_FLUSH_DELAY, self._flush_spill)
+        metrics.queue_spilled_total.labels(lane=self.lane).inc()
+        metrics.queue_spill_size.labels(lane=self.lane).set(len(self.spill))
+        return True
+
+    def _flush_spill(self):
+        self._flush_handle = None
+        self.spill.flush()
+
+    def _refill(self):
+        """Move spilled paths back while the in-memory queue has room"""
+        moved = False
+        while len(self.spill) and not self.queue.full():
+            path, enqueued_at, mtime = self.spill.pop()
+            # Time spent on disk counts as queue wait
+            self.enqueued_at.setdefault(path, time.monotonic() - max(0.0, time.time() - enqueued_at))
+            self.pending_mtime.setdefault(path, mtime)
+            self.queue.put_nowait(path)
+            moved = True
+        if moved:
+            metrics.queue_spill_size.labels(lane=self.lane).set(len(self.spill))
+
+    def waited(self, item):
+        """Seconds item spent queued, None if it was not put through put()"""
+        self.pending_mtime.pop(item, None)
+        enqueued_at = self.enqueued_at.pop(item, None)
+        if enqueued_at is None:
+            return None
+        return time.monotonic() - enqueued_at
+
+    def oldest_pending_age(self) -> float:
+        """Seconds since the mtime of the oldest queued original, 0 when empty"""
+        mtimes = list(self.pending_mtime.values())
+        if self.spill is not None and self.spill.oldest_mtime() is not None:
+            mtimes.append(self.spill.oldest_mtime())
+        if not mtimes:
+            return 0.0
+        return max(0.0, time.time() - min(mtimes))
+
     def task_done(self):
         """Mark task as complete"""
         self.queue.task_done()
@@ -55,8 +146,42 @@ class QueueManager:
         await self.queue.join()
 
     def qsize(self):
-        """Current queue size"""
-        return self.queue.qsize()
+        """Current queue size, spilled items included"""
+        return self.queue.qsize() + (len(self.spill) if self.spill is not None else 0)
+
+    def busy(self) -> bool:
+        """Anything queued, spilled or being converted"""
+        return bool(self.qsize() or self.currently_processing)
+
+    def wake(self, count: int):
+        """Put count stop sentinels without waiting for room - a full
+        queue has no getters to wake"""
+        for _ in range(count):
+            try:
+                self.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                break
+
+    def close(self):
+        """Write paths still queued in memory back to the overflow tier and
+        close it, everything not converted is resumed on start"""
+        if self.spill is None:
+            return
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        pending = []
+        now, wall = time.monotonic(), time.time()
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not None:
+                pending.append((item,
+                                wall - (now - self.enqueued_at.get(item, now)),
+                                self.pending_mtime.get(item, wall)))
+        self.spill.close(pending)
+        if pending:
+            logger.info("Queued items written to spill", lane=self.lane, items=len(pending))
 
     def mark_processing(self, worker_id: int, file_path: str):
         """Mark item as currently processing"""
@@ -112,7 +237,8 @@ class QueueManager:
             'queue': {
                 'pending': pending_items[:10],  # First 10 pending
                 'pending_count': len(pending_items),
-                'max_size': self.config.max_queue_size
+                'max_size': self.queue.maxsize,
+                'spilled': len(self.spill) if self.spill is not None else 0
             },
             'processing': {
                 'current': list(self.currently_processing.values()),
@@ -0,0 +1,67 @@
+"""
+Background re-optimization of fast encodes when CPU is idle
+"""
+import asyncio
+from pathlib import Path
+from app.worker_pool import WorkerProcess
+import structlog
+
+logger = structlog.get_logger()
+
+WORKER_ID = 'reoptimize'
+
+class Reoptimizer:
+    def __init__(self, config, converter, queue_manager, state, avif_queue=None):
+        self.config = config
+        self.converter = converter
+        # Main lane and, in the hot tier, the AVIF lane
+        self.queues = [queue for queue in (queue_manager, avif_queue) if queue is not None]
+        self.state = state
+        self.running = True
+        # Runs only while the lanes are idle, so it may use any CPU
+        self.process = WorkerProcess(WORKER_ID, config, nice=19,
+                                     layout=converter.layout, pinned=False)
+
+    def _cpu_idle(self) -> bool:
+        """Nothing queued in any lane and system load below threshold"""
+        if any(queue.busy() for queue in self.queues):
+            return False
+        return self.converter.layout.load() < self.config.reoptimize_max_load
+
+    async def start(self):
+        """Re-encode outputs tagged with other profiles in small batches"""
+        if not self.config.reoptimize_enabled:
+            return
+
+        profile = self.config.reoptimize_profile
+        self.converter.processes[WORKER_ID] = self.process
+        logger.info("Starting re-optimization pass", profile=profile)
+
+        while self.running:
+            await asyncio.sleep(self.config.reoptimize_interval)
+            if not self._cpu_idle():
+                continue
+
+            batch = self.state.not_profile(profile, self.config.reoptimize_batch)
+            for record in batch:
+                if not self.running or not self._cpu_idle():
+                    break
+                try:
+                    await self.converter.reencode(
+                        Path(record['source']), Path(record['path']),
+                        record['format'], profile, WORKER_ID
+                    )
+                except Exception as e:
+                    # Tag anyway so a broken file is not retried forever
+                    self.state.record(record['path'], record['source'], record['format'],
+                                      reoptimized=profile)
+                    logger.warning("Re-optimization failed",
+                                   file=record['path'],
+                                   error=str(e))
+
+            await self.process.maybe_recycle()
+
+    async def stop(self):
+        """Stop re-optimization pass"""
+        self.running = False
+        await self.process.stop()
@@ -0,0 +1,70 @@
+"""
+Downscaling of oversized originals and responsive width variants
+"""
+import os
+from pathlib import Path
+from fnmatch import fnmatch
+from PIL import Image
+
+def max_side_for(original_path, config):
+    """Max output side from the first matching max_dimensions glob, None if unlimited"""
+    rel_path = os.path.relpath(original_path, config.watch_dir)
+    for pattern, max_side in config.max_dimensions.items():
+        if fnmatch(rel_path, pattern):
+            return max_side or None
+    return None
+
+def fit_size(size, max_side: int):
+    """Size scaled down so the longer side is at most max_side"""
+    width, height = size
+    scale = max(width, height) / max_side
+    if scale <= 1:
+        return size
+    return (max(1, round(width / scale)), max(1, round(height / scale)))
+
+def draft(img: Image.Image, max_side: int):
+    """Let JPEG decoder skip DCT scales below target (must run before load)"""
+    target = fit_size(img.size, max_side)
+    if target != img.size and img.format == 'JPEG':
+        img.draft(img.mode, target)
+
+def downscale(img: Image.Image, max_side: int) -> Image.Image:
+    """Downscale to max_side: cheap integer reduce() first, then one resample"""
+    target = fit_size(img.size, max_side)
+    if target == img.size:
+        return img
+
+    # Keep at least 2x headroom for the final resample (Pillow's reducing_gap)
+    factor = int(min(img.width / target[0], img.height / target[1]) / 2)
+    if factor > 1:
+        img = img.reduce(factor)
+
+    return img.resize(target, Image.Resampling.LANCZOS)
+
+def resize_step(img: Image.Image, width: int) -> Image.Image:
+    """Resize to width: reduce() for exact integer ratios, otherwise
+    LANCZOS with reducing_gap so Pillow box-reduces most of the way first"""
+    ratio = img.width / width
+    factor = int(ratio)
+    if factor == ratio and img.height % factor == 0:
+        return img.reduce(factor)
+
+    height = max(1, round(img.height / ratio))
+    return img.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+def variant_path(original_path, width: int, fmt: str) -> Path:
+    """Responsive variant name: photo.jpg -> photo.640w.webp"""
+    original_path = Path(original_path)
+    return original_path.with_name(f'{original_path.stem}.{width}w.{fmt}')
+
+def variant_width(original_path, output_path):
+    """Width of a responsive variant output of original_path, None for the full-size output"""
+    original_path, output_path = Path(original_path), Path(output_path)
+    prefix = f'{original_path.stem}.'
+    name = output_path.stem
+    if output_path.parent != original_path.parent or not name.startswith(prefix):
+        return None
+    width = name[len(prefix):]
+    if not width.endswith('w') or not width[:-1].isdigit():
+        return None
+    return int(width[:-1])
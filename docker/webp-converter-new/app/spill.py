@@ -0,0 +1,180 @@
+"""
+On-disk overflow for the conversion queue: append-only segment files
+"""
+import os
+from collections import deque
+from pathlib import Path
+import structlog
+
+logger = structlog.get_logger()
+
+SEGMENT_PATTERN = 'segment-*.spill'
+
+class Segment:
+    """One segment file: entries written, entries read, oldest original mtime"""
+
+    def __init__(self, path: Path, entries: int = 0, min_mtime: float = None):
+        self.path = path
+        self.entries = entries
+        self.read = 0
+        self.min_mtime = min_mtime
+
+class SpillQueue:
+    """FIFO of paths kept in segment files of at most segment_size entries.
+
+    Each line is "enqueued_at<TAB>mtime<TAB>path", with the path relative
+    to root when it lies below it. Only the open file handles and
+    per-segment counters stay in memory, however long the backlog.
+    Segments found on start are resumed from their first line, close()
+    drops the lines of the head segment that were already read. Appends
+    are buffered until flush(), which the owner calls on a short timer.
+    """
+
+    def __init__(self, directory, root: str, segment_size: int = 100000):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.root = os.fsencode(root.rstrip('/') + '/')
+        self.segment_size = max(1, segment_size)
+        self.segments = deque()
+        self.count = 0
+        self.sequence = 0
+        self.writer = None
+        self.reader = None
+        self._resume()
+
+    def _resume(self):
+        """Pick up segments left by the previous run"""
+        for path in sorted(self.directory.glob(SEGMENT_PATTERN)):
+            segment = Segment(path)
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Torn write at crash - drop the partial line
+                        break
+                    segment.entries += 1
+                    mtime = float(line.split(b'\t', 2)[1])
+                    if segment.min_mtime is None or mtime < segment.min_mtime:
+                        segment.min_mtime = mtime
+            self.sequence = max(self.sequence, int(path.stem.split('-')[1]))
+            if segment.entries:
+                self.segments.append(segment)
+                self.count += segment.entries
+            else:
+                path.unlink()
+        if self.count:
+            logger.info("Resuming spilled queue",
+                       directory=str(self.directory),
+                       entries=self.count,
+                       segments=len(self.segments))
+
+    def __len__(self):
+        return self.count
+
+    def _line(self, path: str, enqueued_at: float, mtime: float):
+        """Segment file line for path, None if it cannot be stored in one"""
+        encoded = os.fsencode(path)
+        if b'\n' in encoded:
+            return None
+        if encoded.startswith(self.root):
+            encoded = encoded[len(self.root):]
+        return b'%.3f\t%.0f\t%s\n' % (enqueued_at, mtime, encoded)
+
+    def append(self, path: str, enqueued_at: float, mtime: float) -> bool:
+        """Add path at the tail, False if it cannot be stored in a line"""
+        line = self._line(path, enqueued_at, mtime)
+        if line is None:
+            return False
+
+        tail = self.segments[-1] if self.segments else None
+        if tail is None or tail.entries >= self.segment_size or self.writer is None:
+            tail = self._new_segment()
+        self.writer.write(line)
+        tail.entries += 1
+        if tail.min_mtime is None or mtime < tail.min_mtime:
+            tail.min_mtime = mtime
+        self.count += 1
+        return True
+
+    def _new_segment(self) -> Segment:
+        if self.writer:
+            self.writer.close()
+        self.sequence += 1
+        segment = Segment(self.directory / f'segment-{self.sequence:08d}.spill')
+        self.writer = open(segment.path, 'ab')
+        self.segments.append(segment)
+        return segment
+
+    def pop(self):
+        """(path, enqueued_at, mtime) from the head, None when empty"""
+        if not self.count:
+            return None
+
+        head = self.segments[0]
+        if self.writer and head is self.segments[-1]:
+            # Reading the segment still being written
+            self.writer.flush()
+        if self.reader is None:
+            self.reader = open(head.path, 'rb')
+
+        enqueued_at, mtime, encoded = self.reader.readline().rstrip(b'\n').split(b'\t', 2)
+        head.read += 1
+        self.count -= 1
+        if head.read >= head.entries:
+            self._finish_head()
+
+        if not encoded.startswith(b'/'):
+            encoded = self.root + encoded
+        return os.fsdecode(encoded), float(enqueued_at), float(mtime)
+
+    def _finish_head(self):
+        """Delete a fully read segment"""
+        head = self.segments.popleft()
+        self.reader.close()
+        self.reader = None
+        if not self.segments and self.writer:
+            self.writer.close()
+            self.writer = None
+        head.path.unlink(missing_ok=True)
+
+    def oldest_mtime(self):
+        """Oldest original mtime still spilled, per segment - the head
+        segment may report an entry that was already read"""
+        mtimes = [segment.min_mtime for segment in self.segments if segment.min_mtime is not None]
+        return min(mtimes) if mtimes else None
+
+    def flush(self):
+        """Hand buffered appends to the OS, so they survive a crash of the process"""
+        if self.writer:
+            self.writer.flush()
+
+    def close(self, pending=()):
+        """Flush and close the segment files.
+
+        pending (path, enqueued_at, mtime) items, taken out of the spill or
+        never spilled but not converted, are written ahead of everything
+        still spilled. The read part of the head segment is dropped in the
+        same rewrite, so nothing is queued twice after a restart.
+        """
+        self.flush()
+        lines = [line for line in (self._line(*item) for item in pending) if line]
+        head = self.segments[0] if self.segments else None
+        if lines or (head is not None and head.read):
+            if head is None:
+                self.sequence += 1
+                path = self.directory / f'segment-{self.sequence:08d}.spill'
+                rest = b''
+            else:
+                path = head.path
+                if self.reader is None:
+                    self.reader = open(path, 'rb')
+                rest = self.reader.read()
+            tmp_path = path.with_name(path.name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.writelines(lines)
+                f.write(rest)
+            os.replace(tmp_path, path)
+
+        for handle in (self.reader, self.writer):
+            if handle:
+                handle.close()
+        self.reader = self.writer = None
@@ -0,0 +1,172 @@
+"""
+Persistent per-output conversion state (SQLite)
+"""
+import os
+import json
+import time
+import sqlite3
+from pathlib import Path
+from app.resize import variant_width
+import structlog
+
+logger = structlog.get_logger()
+
+# Column name -> SQL type. New columns are added to existing databases on open.
+COLUMNS = {
+    'source': 'TEXT NOT NULL',
+    'format': 'TEXT NOT NULL',
+    'profile': 'TEXT',
+    'size': 'INTEGER',
+    'pruned': 'INTEGER NOT NULL DEFAULT 0',
+    'source_mtime': 'REAL',
+    'settings': 'TEXT',
+    'reoptimized': 'TEXT',  # profile the re-optimization pass last tried
+    'updated_at': 'REAL',
+}
+
+class StateStore:
+    """Records how every output file was produced.
+
+    Keyed by output path, so background passes can find outputs that
+    need work and resume after a restart.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.create_function('is_variant', 2, lambda path, source:
+                                variant_width(source, path) is not None, deterministic=True)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self._migrate()
+
+    def _migrate(self):
+        """Create table and add columns missing from older databases"""
+        self.db.execute('CREATE TABLE IF NOT EXISTS outputs (path TEXT PRIMARY KEY)')
+        existing = {row['name'] for row in self.db.execute('PRAGMA table_info(outputs)')}
+        for name, sql_type in COLUMNS.items():
+            if name not in existing:
+                # NOT NULL needs a default when added to an existing table
+                if 'DEFAULT' not in sql_type:
+                    sql_type = sql_type.replace('NOT NULL', "NOT NULL DEFAULT ''")
+                self.db.execute(f'ALTER TABLE outputs ADD COLUMN {name} {sql_type}')
+        self.db.execute('CREATE INDEX IF NOT EXISTS outputs_profile ON outputs (profile)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS outputs_settings ON outputs (format, settings)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS outputs_source ON outputs (source, format)')
+        # Small JSON documents for background passes (campaign progress)
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.db.commit()
+
+    def record(self, output_path: Path, source_path: Path, fmt: str, **fields):
+        """Insert or update output record"""
+        values = {
+            'path': str(output_path),
+            'source': str(source_path),
+            'format': fmt,
+            'updated_at': time.time(),
+            **fields
+        }
+        columns = ', '.join(values)
+        placeholders = ', '.join('?' for _ in values)
+        updates = ', '.join(f'{name}=excluded.{name}' for name in values if name != 'path')
+        self.db.execute(
+            f'INSERT INTO outputs ({columns}) VALUES ({placeholders}) '
+            f'ON CONFLICT(path) DO UPDATE SET {updates}',
+            list(values.values())
+        )
+        self.db.commit()
+
+    def seed(self, rows) -> int:
+        """Insert (path, source, format, size, source_mtime) rows for outputs
+        without a record, with unknown settings; returns rows added"""
+        now = time.time()
+        cursor = self.db.executemany(
+            'INSERT OR IGNORE INTO outputs (path, source, format, size, source_mtime, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(*row, now) for row in rows]
+        )
+        self.db.commit()
+        return cursor.rowcount
+
+    def get(self, output_path: Path):
+        """Get output record or None"""
+        row = self.db.execute(
+            'SELECT * FROM outputs WHERE path = ?', (str(output_path),)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def is_pruned(self, output_path: Path, source_mtime: float) -> bool:
+        """Output was discarded (pruned or left unconverted) for this version of its source"""
+        record = self.get(output_path)
+        return bool(record and record['pruned'] and record['source_mtime'] == source_mtime)
+
+    def forget(self, output_path: Path):
+        """Remove output record"""
+        self.db.execute('DELETE FROM outputs WHERE path = ?', (str(output_path),))
+        self.db.commit()
+
+    def not_profile(self, profile: str, limit: int):
+        """Oldest outputs encoded with a profile other than given one,
+        and not yet tried with it"""
+        rows = self.db.execute(
+            'SELECT * FROM outputs WHERE profile IS NOT NULL AND profile != ? '
+            'AND (reoptimized IS NULL OR reoptimized != ?) '
+            'ORDER BY updated_at LIMIT ?',
+            (profile, profile, limit)
+        )
+        return [dict(row) for row in rows]
+
+    def outdated(self, fmt: str, settings: str, limit: int):
+        """Full-size outputs of format produced with other (or unrecorded)
+        settings; width variants are regenerated together with them"""
+        rows = self.db.execute(
+            'SELECT * FROM outputs WHERE format = ? AND (settings IS NULL OR settings != ?) '
+            'AND NOT is_variant(path, source) ORDER BY path LIMIT ?',
+            (fmt, settings, limit)
+        )
+        return [dict(row) for row in rows]
+
+    def missing(self, fmt: str, limit: int):
+        """Sources with outputs in other formats but no record for format"""
+        rows = self.db.execute(
+            'SELECT DISTINCT source FROM outputs o WHERE format != ? '
+            'AND NOT EXISTS (SELECT 1 FROM outputs WHERE source = o.source AND format = ?) '
+            'ORDER BY source LIMIT ?',
+            (fmt, fmt, limit)
+        )
+        return [row['source'] for row in rows]
+
+    def count_outdated(self, fmt: str, settings: str) -> int:
+        return self.db.execute(
+            'SELECT COUNT(*) FROM outputs WHERE format = ? AND (settings IS NULL OR settings != ?) '
+            'AND NOT is_variant(path, source)',
+            (fmt, settings)
+        ).fetchone()[0]
+
+    def count_missing(self, fmt: str) -> int:
+        return self.db.execute(
+            'SELECT COUNT(DISTINCT source) FROM outputs o WHERE format != ? '
+            'AND NOT EXISTS (SELECT 1 FROM outputs WHERE source = o.source AND format = ?)',
+            (fmt, fmt)
+        ).fetchone()[0]
+
+    def get_meta(self, key: str):
+        """Stored JSON value or None"""
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['value']) if row else None
+
+    def set_meta(self, key: str, value):
+        self.db.execute(
+            'INSERT INTO meta (key, value) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value=excluded.value',
+            (key, json.dumps(value))
+        )
+        self.db.commit()
+
+    def close(self):
+        """Close database"""
+        self.db.close()
@@ -0,0 +1,159 @@
+"""
+Streaming conversion engine on libvips: bounded memory, no full-size copies
+"""
+import time
+import resource
+import tempfile
+import dataclasses
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from app.resize import max_side_for
+from app.metadata import TRANSPOSED_ORIENTATIONS
+
+# libvips is optional; pyvips raises OSError when the shared library is missing
+try:
+    import pyvips
+    # Every file is opened once - the operation cache would only pin memory
+    pyvips.cache_set_max(0)
+    VIPS_SUPPORT = True
+except (ImportError, OSError):
+    VIPS_SUPPORT = False
+
+def _orientation(image) -> int:
+    if image.get_typeof('orientation'):
+        return image.get('orientation')
+    return 1
+
+def _has_icc(image) -> bool:
+    return bool(image.get_typeof('icc-profile-data'))
+
+def _metadata_args(config, icc_kept: bool) -> dict:
+    """keep (libvips >= 8.15) or strip saver argument for the metadata policy"""
+    if not pyvips.at_least_libvips(8, 15):
+        # Older savers strip all or nothing - stripping wins unless all is kept
+        return {'strip': config.strip_metadata or not icc_kept}
+
+    keep = [] if config.strip_metadata else ['exif', 'xmp']
+    if icc_kept:
+        keep.append('icc')
+    return {'keep': ','.join(keep) or 'none'}
+
+def load_image(original_path: Path, config):
+    """Open for a sequential top-to-bottom read, shrinking on load when
+    a max dimension applies.
+
+    Returns image and metadata stats as in apply_metadata_policy.
+    """
+    path = str(original_path)
+    image = pyvips.Image.new_from_file(path, access='sequential')
+    orientation = _orientation(image)
+    original_size = (image.width, image.height)
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        original_size = original_size[::-1]
+    max_side = max_side_for(original_path, config)
+
+    if max_side and max(image.width, image.height) > max_side:
+        # thumbnail decodes JPEG/WebP at reduced scale and applies orientation
+        image = pyvips.Image.thumbnail(path, max_side, height=max_side, size='down')
+    elif orientation != 1:
+        # Rotation needs random access to the decoded rows
+        image = pyvips.Image.new_from_file(path).autorot()
+
+    icc = image.get('icc-profile-data') if _has_icc(image) else b''
+    removed = {}
+    if config.strip_metadata:
+        removed['exif'] = len(image.get('exif-data')) if image.get_typeof('exif-data') else 0
+        removed['xmp'] = len(image.get('xmp-data')) if image.get_typeof('xmp-data') else 0
+
+    policy = config.icc_policy
+    if icc and policy == 'srgb':
+        try:
+            image = image.icc_transform('srgb', embedded=True)
+        except pyvips.Error:
+            # Broken profile - keep it rather than shift colors
+            policy = 'keep'
+    if not (icc and policy == 'keep'):
+        removed['icc'] = len(icc)
+
+    # 8-bit sRGB (with alpha if present) as the encoders expect
+    if image.interpretation not in ('srgb', 'b-w') or image.format != 'uchar':
+        image = image.colourspace('srgb')
+    if image.format != 'uchar':
+        image = image.cast('uchar')
+
+    return image, {'orientation_applied': orientation != 1,
+                   'removed': removed,
+                   'icc_kept': bool(icc) and policy == 'keep',
+                   'downscaled': (image.width, image.height) != original_size}
+
+def save_image(image, output_path: Path, fmt: str, options: dict, config, icc_kept: bool):
+    """Encode with the libvips saver for format; options are Pillow-style"""
+    args = _metadata_args(config, icc_kept)
+    if fmt == 'webp':
+        image.webpsave(str(output_path), Q=options['quality'],
+                       effort=options.get('method', 4),
+                       lossless=options.get('lossless', False),
+                       alpha_q=options.get('alpha_quality', 100), **args)
+    elif fmt == 'avif':
+        # heifsave effort 0-9 runs opposite to AVIF speed
+        image.heifsave(str(output_path), Q=options['quality'],
+                       compression='av1', effort=max(0, 9 - options.get('speed', 6)),
+                       lossless=options.get('lossless', False), **args)
+    else:
+        image.jpegsave(str(output_path), Q=options['quality'],
+                       optimize_coding=True, interlace=True, **args)
+
+def convert_vips_sync(original_path: Path, output_path: Path, fmt: str, options: dict, config) -> dict:
+    """Synchronous streaming conversion (runs in worker process), returns encode stats"""
+    image, metadata = load_image(original_path, config)
+    save_image(image, output_path, fmt, options, config, metadata.pop('icc_kept'))
+    return {'content_class': 'photo_alpha' if image.hasalpha() else 'photo',
+            'alpha_dropped': False,
+            'downscaled': metadata.pop('downscaled'),
+            **metadata}
+
+def _bench_engine(engine: str, paths, formats, config) -> dict:
+    """Convert corpus with one engine (runs in a fresh process)"""
+    from app.converter import convert_sync
+
+    config = dataclasses.replace(config, conversion_engine=engine)
+    # Peak RSS before the first image covers interpreter and imports
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    output_bytes = 0
+    start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix=f'bench-{engine}-') as tmp_dir:
+        for i, path in enumerate(paths):
+            for fmt in formats:
+                output_path = Path(tmp_dir) / f'{i}.{fmt}'
+                convert_sync(Path(path), output_path, fmt, config, config.encode_profile)
+                output_bytes += output_path.stat().st_size
+                output_path.unlink()
+
+    return {'seconds': time.perf_counter() - start,
+            'output_bytes': output_bytes,
+            'baseline_rss_mb': baseline_kb / 1024,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+def benchmark_engines(paths, config, formats=('webp', 'avif')):
+    """Peak RSS and throughput of the pillow and vips engines on one corpus.
+
+    Each engine runs in its own spawned process so peak RSS is not shared.
+    Returns {'files', 'original_bytes', 'engines': {engine: totals}}.
+    """
+    engines = ['pillow'] + (['vips'] if VIPS_SUPPORT else [])
+    original_bytes = sum(Path(path).stat().st_size for path in paths)
+    results = {}
+
+    for engine in engines:
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            totals = executor.submit(_bench_engine, engine, list(paths), formats, config).result()
+        conversions = len(paths) * len(formats)
+        totals['images_per_second'] = conversions / totals['seconds'] if totals['seconds'] else 0
+        totals['mb_per_second'] = (original_bytes * len(formats) / 2**20 / totals['seconds']
+                                   if totals['seconds'] else 0)
+        results[engine] = totals
+
+    return {'files': len(paths), 'original_bytes': original_bytes, 'engines': results}
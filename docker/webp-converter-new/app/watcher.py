@@ -2,18 +2,70 @@
 File system monitoring with watchdog
 """
 import asyncio
+import threading
+from itertools import islice
 from pathlib import Path
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from app.metrics import metrics
 import structlog
 
 logger = structlog.get_logger()
 
+class EventBuffer:
+    """Bounded hand-off of paths from the observer thread to the event loop.
+
+    The thread wakes the loop only when the buffer turns non-empty, and
+    the loop drains it in chunks, instead of one scheduled coroutine per
+    event. Repeated events for a path still waiting here (created, then
+    modified while being written) collapse into one. When full, the
+    observer thread waits for the loop to catch up.
+    """
+
+    def __init__(self, loop, maxsize: int):
+        self.loop = loop
+        self.maxsize = maxsize
+        self.paths = {}  # insertion-ordered set
+        self.condition = threading.Condition()
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def add(self, path: str):
+        """Called from the observer thread"""
+        with self.condition:
+            while len(self.paths) >= self.maxsize and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return
+            wake = not self.paths
+            self.paths[path] = None
+        if wake:
+            self.loop.call_soon_threadsafe(self.ready.set)
+
+    def take(self, limit: int) -> list:
+        """Called from the event loop: up to limit paths in arrival order"""
+        with self.condition:
+            chunk = list(islice(self.paths, limit))
+            for path in chunk:
+                del self.paths[path]
+            if not self.paths:
+                self.ready.clear()
+            self.condition.notify_all()
+        return chunk
+
+    def __len__(self):
+        return len(self.paths)
+
+    def close(self):
+        """Release an observer thread waiting for space"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
 class ImageFileHandler(FileSystemEventHandler):
-    def __init__(self, config, queue_manager, loop):
+    def __init__(self, config, buffer):
         self.config = config
-        self.queue = queue_manager
-        self.loop = loop
+        self.buffer = buffer
 
     def on_created(self, event):
         if not event.is_directory:
@@ -29,10 +81,7 @@ class ImageFileHandler(FileSystemEventHandler):
 
         # Check extension
         if path.suffix.lower().lstrip('.') in self.config.extensions:
-            asyncio.run_coroutine_threadsafe(
-                self.queue.put(str(path)),
-                self.loop
-            )
+            self.buffer.add(str(path))
             logger.debug("File detected", file=str(path))
 
 class FileWatcher:
@@ -41,15 +90,18 @@ class FileWatcher:
         self.queue = queue_manager
         self.observer = Observer()
         self.event_handler = None
+        self.buffer = None
+        self.drainer = None
 
     async def start(self):
         """Start file monitoring"""
         logger.info("Starting file watcher",
                    directory=self.config.watch_dir)
 
-        # Get current event loop and pass to handler
-        loop = asyncio.get_running_loop()
-        self.event_handler = ImageFileHandler(self.config, self.queue, loop)
+        # Events reach the loop through the buffer, drained by a task
+        self.buffer = EventBuffer(asyncio.get_running_loop(), self.config.watcher_buffer_size)
+        self.event_handler = ImageFileHandler(self.config, self.buffer)
+        self.drainer = asyncio.create_task(self._drain())
 
         self.observer.schedule(
             self.event_handler,
@@ -62,6 +114,16 @@ class FileWatcher:
         while self.observer.is_alive():
             await asyncio.sleep(1)
 
+    async def _drain(self):
+        """Move buffered paths into the queue, watcher_batch_size at a time"""
+        while True:
+            await self.buffer.ready.wait()
+            for path in self.buffer.take(self.config.watcher_batch_size):
+                await self.queue.put(path)
+            metrics.watcher_buffered.set(len(self.buffer))
+            # Let workers and the metrics server run between chunks
+            await asyncio.sleep(0)
+
     async def initial_scan(self):
         """Initial scan of existing files"""
         logger.info("Starting initial scan",
@@ -81,4 +143,8 @@ class FileWatcher:
         """Stop monitoring"""
         logger.info("Stopping file watcher")
         self.observer.stop()
+        if self.buffer:
+            self.buffer.close()
         self.observer.join()
+        if self.drainer:
+            self.drainer.cancel()
@@ -0,0 +1,123 @@
+"""
+Isolated conversion processes with RSS guard and recycling
+"""
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.metrics import metrics, release_process
+from app.cpu_layout import init_worker
+import structlog
+
+logger = structlog.get_logger()
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+def current_rss() -> int:
+    """Resident set size of the current process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _run_task(func, args):
+    """Run task inside worker process and report RSS and pid after it"""
+    return func(*args), current_rss(), os.getpid()
+
+class WorkerProcess:
+    """Dedicated conversion process owned by one async worker.
+
+    Pillow/libheif fragment the heap over time, so the process is replaced
+    after a number of images or once its RSS crosses the limit. Recycling
+    happens only between files, so in-flight work is never lost.
+    """
+
+    def __init__(self, worker_id, config, nice: int = 0, layout=None, pinned: bool = True):
+        self.worker_id = worker_id
+        self.config = config
+        self.nice = nice
+        self.layout = layout
+        self.pinned = pinned
+        self.executor = None
+        self.images = 0
+        self.rss = 0
+        self.pid = None
+
+    def _spawn(self):
+        """Start a fresh worker process"""
+        cpus, threads = (self.layout.assign(self.worker_id, self.pinned)
+                         if self.layout else (None, 0))
+        self.executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(self.nice, cpus, threads)
+        )
+        self.images = 0
+        self.rss = 0
+
+    async def run(self, func, *args):
+        """Run picklable func(*args) in the worker process"""
+        if self.executor is None:
+            self._spawn()
+
+        loop = asyncio.get_running_loop()
+        try:
+            result, self.rss, self.pid = await loop.run_in_executor(
+                self.executor, _run_task, func, args
+            )
+        except BrokenProcessPool:
+            # Process was killed (OOM, segfault in codec) - caller retries
+            logger.warning("Worker process died", worker_id=self.worker_id)
+            await self.recycle('crash')
+            raise
+
+        self.images += 1
+        metrics.worker_rss.labels(worker=str(self.worker_id)).set(self.rss)
+        return result
+
+    async def maybe_recycle(self):
+        """Recycle process if image count or RSS limit is exceeded"""
+        if self.executor is None:
+            return
+
+        max_images = self.config.worker_max_images
+        max_rss = self.config.worker_max_rss_mb * 1024 * 1024
+
+        if max_images and self.images >= max_images:
+            await self.recycle('images')
+        elif max_rss and self.rss >= max_rss:
+            await self.recycle('rss')
+
+    async def recycle(self, reason: str):
+        """Shut down current process, next task spawns a new one"""
+        executor, self.executor = self.executor, None
+        if executor is None:
+            return
+
+        logger.info("Recycling worker process",
+                   worker_id=self.worker_id,
+                   reason=reason,
+                   images=self.images,
+                   rss_mb=round(self.rss / 1024 / 1024, 1))
+
+        await asyncio.to_thread(executor.shutdown, wait=True)
+        self._release()
+        metrics.worker_recycles.labels(reason=reason).inc()
+
+    async def stop(self):
+        """Stop worker process"""
+        executor, self.executor = self.executor, None
+        if executor is not None:
+            await asyncio.to_thread(executor.shutdown, wait=True)
+            self._release()
+
+    def _release(self):
+        """Fold the finished process's multiprocess metric files into the archive
+        and zero its RSS, so no stale value stays exported"""
+        pid, self.pid = self.pid, None
+        release_process(pid)
+        self.rss = 0
+        metrics.worker_rss.labels(worker=str(self.worker_id)).set(0)
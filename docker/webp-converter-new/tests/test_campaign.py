@@ -0,0 +1,91 @@
+import asyncio
+import dataclasses
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from app.config import Config
+from app.state import StateStore
+from app.campaign import ReencodeCampaign, parse_window, in_window, window_fraction, scan_outputs
+
+def at(hour, minute=0):
+    return datetime(2026, 1, 1, hour, minute)
+
+def campaign(tmp_path, **overrides):
+    config = dataclasses.replace(Config(), watch_dir=str(tmp_path), **overrides)
+    converter = SimpleNamespace(layout=None, formats=('webp',), processes={})
+    return ReencodeCampaign(config, converter, None, StateStore(':memory:'))
+
+def test_parse_window():
+    assert parse_window('') is None
+    assert parse_window('01:30-06:00') == (90, 360)
+    assert parse_window('22-4') == (1320, 240)
+
+def test_in_window():
+    assert in_window(None, at(12))
+    day = parse_window('09:00-17:00')
+    assert in_window(day, at(9)) and in_window(day, at(16, 59))
+    assert not in_window(day, at(17)) and not in_window(day, at(8, 59))
+
+def test_in_window_past_midnight():
+    night = parse_window('22:00-04:00')
+    assert in_window(night, at(23)) and in_window(night, at(0)) and in_window(night, at(3, 59))
+    assert not in_window(night, at(4)) and not in_window(night, at(12))
+
+def test_window_fraction():
+    assert window_fraction(None) == 1.0
+    assert window_fraction(parse_window('00:00-06:00')) == 0.25
+    assert window_fraction(parse_window('22:00-04:00')) == 0.25
+    # Equal start and end covers the whole day
+    assert window_fraction(parse_window('03:00-03:00')) == 1.0
+
+def test_eta(tmp_path):
+    reencode = campaign(tmp_path, campaign_window='00:00-06:00', campaign_cpu_share=0.5)
+    reencode.progress = {'total': 100, 'done': 0, 'active_seconds': 0.0, 'finished_at': None}
+    assert reencode.eta() is None
+
+    reencode.progress.update(done=20, active_seconds=40.0)
+    # 80 left at 2 s each, encoding half the time for a quarter of the day
+    assert reencode.eta() == pytest.approx(80 * 2 / (0.5 * 0.25))
+
+    reencode.progress['finished_at'] = 1.0
+    assert reencode.eta() is None
+
+def test_scan_outputs(tmp_path):
+    (tmp_path / 'a').mkdir()
+    for name in ('a/1.jpg', 'a/1.webp', 'a/1.avif', 'a/2.png', 'a/1.640w.webp', 'orphan.webp'):
+        (tmp_path / name).write_bytes(b'x')
+
+    rows = [row for batch in scan_outputs(str(tmp_path), ['jpg', 'png'], ['webp', 'avif'])
+            for row in batch]
+    assert sorted((path, fmt) for path, _, fmt, _, _ in rows) == [
+        (str(tmp_path / 'a/1.avif'), 'avif'), (str(tmp_path / 'a/1.webp'), 'webp')]
+    assert {source for _, source, _, _, _ in rows} == {str(tmp_path / 'a/1.jpg')}
+
+def test_seed_counts_untracked_outputs_once(tmp_path):
+    for name in ('1.jpg', '1.webp', '2.jpg', '2.webp'):
+        (tmp_path / name).write_bytes(b'x')
+    reencode = campaign(tmp_path, enable_avif=False)
+    reencode.state.record(tmp_path / '2.webp', tmp_path / '2.jpg', 'webp', settings='current')
+    reencode.state.set_meta('campaign', {'settings': reencode._settings(), 'finished_at': 1})
+
+    asyncio.run(reencode._seed())
+    assert reencode.state.get(tmp_path / '1.webp')['settings'] is None
+    assert reencode.state.get(tmp_path / '2.webp')['settings'] == 'current'
+    # The finished campaign for the same settings is reset to count the new row
+    reencode._load()
+    assert reencode.progress['total'] == 2 and not reencode.progress['finished_at']
+
+    (tmp_path / '3.jpg').write_bytes(b'x')
+    (tmp_path / '3.webp').write_bytes(b'x')
+    asyncio.run(reencode._seed())
+    assert reencode.state.get(tmp_path / '3.webp') is None
+
+def test_variant_rows_not_counted(tmp_path):
+    reencode = campaign(tmp_path, enable_avif=False)
+    source = tmp_path / '1.jpg'
+    for path in ('1.webp', '1.640w.webp', '1.320w.webp'):
+        reencode.state.record(tmp_path / path, source, 'webp', settings='old')
+    reencode._load()
+    # One source, counted once, so done reaches total after its refresh
+    assert reencode.progress['total'] == 1
+    assert reencode._pending() == {source: {'webp'}}
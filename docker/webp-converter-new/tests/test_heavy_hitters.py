@@ -0,0 +1,66 @@
+import random
+from collections import Counter
+from types import SimpleNamespace
+from app.heavy_hitters import SpaceSaving, DirectoryTracker
+
+def zipf_stream(keys: int, length: int, seed: int = 7):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(keys)]
+    return rng.choices(range(keys), weights=weights, k=length)
+
+def test_exact_below_capacity():
+    tracker = SpaceSaving(10)
+    for key in 'aabbbc':
+        tracker.add(key)
+    assert tracker.top(2) == [('b', 3, 0), ('a', 2, 0)]
+    assert tracker.total == 6
+
+def test_error_bounds():
+    capacity = 50
+    stream = zipf_stream(keys=2000, length=20000)
+    tracker = SpaceSaving(capacity)
+    for key in stream:
+        tracker.add(key)
+    truth = Counter(stream)
+
+    assert len(tracker.counts) == capacity
+    for key, count, error in tracker.top(capacity):
+        # Overestimate by at most the inherited error, never under
+        assert count - error <= truth[key] <= count
+        assert error <= tracker.total / capacity
+    # Every key above total / capacity is guaranteed to be tracked
+    for key, count in truth.items():
+        if count > tracker.total / capacity:
+            assert key in tracker.counts
+
+def test_weighted_top_order():
+    tracker = SpaceSaving(3)
+    tracker.add('small', 1.5)
+    tracker.add('big', 100)
+    tracker.add('mid', 10)
+    tracker.add('new', 2)
+    # 'new' evicted the smallest entry and inherited its count as error
+    assert 'small' not in tracker.counts
+    assert tracker.top(1) == [('big', 100, 0)]
+    assert tracker.counts['new'] == [3.5, 1.5]
+
+def test_directory_depth():
+    config = SimpleNamespace(watch_dir='/srv/upload', heavy_hitters_depth=2,
+                             heavy_hitters_capacity=10, top_directories=5)
+    tracker = DirectoryTracker(config)
+    assert tracker.directory('/srv/upload/iblock/abc/def/1.jpg') == 'iblock/abc'
+    assert tracker.directory('/srv/upload/1.jpg') == '.'
+    assert tracker.directory('/other/dir/1.jpg') == '/other'
+
+def test_collector_ranks():
+    config = SimpleNamespace(watch_dir='/srv/upload', heavy_hitters_depth=1,
+                             heavy_hitters_capacity=10, top_directories=1)
+    tracker = DirectoryTracker(config)
+    tracker.record('/srv/upload/a/1.jpg', 100, 0.5)
+    tracker.record('/srv/upload/b/1.jpg', 300, 0.1)
+    tracker.record('/srv/upload/b/2.jpg', 300, 0.1)
+    families = {family.name: family for family in tracker.collect()}
+    [files] = families['webp_top_directory_files'].samples
+    assert files.labels == {'rank': '1', 'directory': 'b'} and files.value == 2
+    [cpu] = families['webp_top_directory_cpu_seconds'].samples
+    assert cpu.labels['directory'] == 'a'
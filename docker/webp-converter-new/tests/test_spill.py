@@ -0,0 +1,100 @@
+from app.spill import SpillQueue, SEGMENT_PATTERN
+
+ROOT = '/srv/upload'
+
+def drain(spill):
+    items = []
+    while (item := spill.pop()) is not None:
+        items.append(item)
+    return items
+
+def test_fifo_across_segments(tmp_path):
+    spill = SpillQueue(tmp_path, ROOT, segment_size=3)
+    for i in range(10):
+        assert spill.append(f'{ROOT}/a/{i}.jpg', 100.0 + i, 1000.0 + i)
+    assert len(spill) == 10
+    assert len(list(tmp_path.glob(SEGMENT_PATTERN))) == 4
+
+    items = drain(spill)
+    assert [path for path, _, _ in items] == [f'{ROOT}/a/{i}.jpg' for i in range(10)]
+    assert items[0][1:] == (100.0, 1000.0)
+    assert len(spill) == 0
+    # Fully read segments are deleted
+    assert not list(tmp_path.glob(SEGMENT_PATTERN))
+
+def test_interleaved_append_and_pop(tmp_path):
+    spill = SpillQueue(tmp_path, ROOT, segment_size=2)
+    spill.append(f'{ROOT}/1.jpg', 1, 1)
+    spill.append(f'{ROOT}/2.jpg', 2, 2)
+    assert spill.pop()[0] == f'{ROOT}/1.jpg'
+    spill.append(f'{ROOT}/3.jpg', 3, 3)
+    assert [path for path, _, _ in drain(spill)] == [f'{ROOT}/2.jpg', f'{ROOT}/3.jpg']
+    spill.append(f'{ROOT}/4.jpg', 4, 4)
+    assert spill.pop()[0] == f'{ROOT}/4.jpg'
+
+def test_paths_outside_root_and_newlines(tmp_path):
+    spill = SpillQueue(tmp_path, ROOT)
+    assert spill.append('/elsewhere/x.jpg', 1, 1)
+    assert not spill.append(f'{ROOT}/bad\nname.jpg', 1, 1)
+    assert spill.pop()[0] == '/elsewhere/x.jpg'
+    assert spill.pop() is None
+
+def test_resume_after_restart(tmp_path):
+    spill = SpillQueue(tmp_path, ROOT, segment_size=4)
+    for i in range(10):
+        spill.append(f'{ROOT}/{i}.jpg', i, 50.0 - i)
+    spill.close()
+
+    resumed = SpillQueue(tmp_path, ROOT, segment_size=4)
+    assert len(resumed) == 10
+    assert resumed.oldest_mtime() == 41.0
+    assert [path for path, _, _ in drain(resumed)] == [f'{ROOT}/{i}.jpg' for i in range(10)]
+    # New segments continue the sequence instead of reusing names
+    resumed.append(f'{ROOT}/new.jpg', 1, 1)
+    assert resumed.segments[-1].path.name > 'segment-00000003.spill'
+
+def test_torn_last_line_is_dropped(tmp_path):
+    spill = SpillQueue(tmp_path, ROOT)
+    spill.append(f'{ROOT}/1.jpg', 1, 1)
+    spill.append(f'{ROOT}/2.jpg', 2, 2)
+    spill.close()
+    segment = next(tmp_path.glob(SEGMENT_PATTERN))
+    with open(segment, 'ab') as f:
+        f.write(b'3.000\t3\tpartial/na')
+
+    resumed = SpillQueue(tmp_path, ROOT)
+    assert len(resumed) == 2
+    assert [path for path, _, _ in drain(resumed)] == [f'{ROOT}/1.jpg', f'{ROOT}/2.jpg']
+
+def test_empty_segments_removed_on_start(tmp_path):
+    (tmp_path / 'segment-00000007.spill').write_bytes(b'')
+    spill = SpillQueue(tmp_path, ROOT)
+    assert len(spill) == 0
+    assert not list(tmp_path.glob(SEGMENT_PATTERN))
+    spill.append(f'{ROOT}/1.jpg', 1, 1)
+    assert spill.segments[-1].path.name == 'segment-00000008.spill'
+
+def test_appends_reach_the_file_on_flush(tmp_path):
+    spill = SpillQueue(tmp_path, ROOT)
+    spill.append(f'{ROOT}/1.jpg', 1, 1)
+    spill.flush()
+    segment = next(tmp_path.glob(SEGMENT_PATTERN))
+    assert segment.read_bytes() == b'1.000\t1\t1.jpg\n'
+
+def test_close_writes_pending_ahead_of_unread(tmp_path):
+    spill = SpillQueue(tmp_path, ROOT, segment_size=3)
+    for i in range(5):
+        spill.append(f'{ROOT}/{i}.jpg', i, i)
+    # 0 and 1 were refilled into memory, 1 is still queued there
+    spill.pop()
+    spill.pop()
+    spill.close(pending=[(f'{ROOT}/1.jpg', 1, 1), (f'{ROOT}/new.jpg', 9, 9)])
+
+    resumed = SpillQueue(tmp_path, ROOT, segment_size=3)
+    assert [path for path, _, _ in drain(resumed)] == [
+        f'{ROOT}/1.jpg', f'{ROOT}/new.jpg', f'{ROOT}/2.jpg', f'{ROOT}/3.jpg', f'{ROOT}/4.jpg']
+
+def test_close_pending_without_segments(tmp_path):
+    spill = SpillQueue(tmp_path, ROOT)
+    spill.close(pending=[(f'{ROOT}/1.jpg', 1, 1)])
+    assert [path for path, _, _ in drain(SpillQueue(tmp_path, ROOT))] == [f'{ROOT}/1.jpg']